@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# Measure what the generated rules cost at shaping time, by pushing a corpus
+# of number-heavy text through patched fonts with HarfBuzz.
+import argparse
+import contextlib
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+import uharfbuzz as hb
+
+import dgrules
+import dgstats
+
+# Bump when the generated corpus changes, so old baselines aren't compared.
+CORPUS_VERSION = 1
+
+MODES = dgrules.MODES
+
+FEATURE_SETS = ('', 'dgsp', 'dgco', 'dgap', 'dgdc,dgdo', 'dghx,dgsp')
+
+
+def corpus_short(rng):
+    words = ('order', 'shipped', 'units', 'at', 'ref', 'total', 'on', 'of')
+    lines = []
+    for _ in range(400):
+        lines.append(' '.join(
+                str(rng.randrange(10 ** rng.randrange(1, 8)))
+                if rng.random() < 0.4 else rng.choice(words)
+                for _ in range(rng.randrange(3, 10))))
+    return lines
+
+
+def corpus_long(rng):
+    return [ ''.join(rng.choice('0123456789') for _ in range(10000))
+             for _ in range(4) ]
+
+
+def corpus_hexdump(rng):
+    lines = []
+    for n in range(256):
+        data = bytes(rng.randrange(256) for _ in range(16))
+        lines.append(f'{n * 16:08x}  ' + ' '.join(f'{b:02x}' for b in data)
+                     + '  |' + ''.join(chr(b) if 32 <= b < 127 else '.'
+                                       for b in data) + '|')
+        lines.append(f'0x{rng.randrange(1 << 48):012x}: '
+                     f'mov 0x{rng.randrange(1 << 32):x}, %rax')
+    return lines
+
+
+def corpus_colours(rng):
+    return [ f'.c{n} {{ color: #{rng.randrange(1 << 24):06x}; '
+             f'background: #{rng.randrange(1 << 24):06X}; }}'
+             for n in range(400) ]
+
+
+def corpus_decimals(rng):
+    return [ '  '.join(f'{rng.uniform(0, 10 ** rng.randrange(1, 10)):>18.{rng.randrange(1, 9)}f}'
+                       for _ in range(4))
+             for _ in range(400) ]
+
+
+CORPORA = {
+    'short': corpus_short,
+    'long': corpus_long,
+    'hexdump': corpus_hexdump,
+    'colours': corpus_colours,
+    'decimals': corpus_decimals,
+}
+
+
+def load_corpora(names, text_files):
+    corpora = {}
+    for name in names:
+        corpora[name] = CORPORA[name](random.Random(name))
+    for path in text_files:
+        with open(path, encoding='utf-8') as f:
+            corpora[os.path.basename(path)] = f.read().splitlines()
+    return corpora
+
+
+def shape(font, lines, features):
+    glyphs = 0
+    start = time.process_time()
+    for line in lines:
+        buf = hb.Buffer()
+        buf.add_str(line)
+        buf.guess_segment_properties()
+        hb.shape(font, buf, features)
+        glyphs += len(buf)
+    return time.process_time() - start, glyphs
+
+
+def shape_time(fonts, lines, features, repeat):
+    # Best of several runs of each font, in seconds, and the number of glyphs
+    # out.  The fonts take turns, so they see the same conditions.
+    best = [ None ] * len(fonts)
+    glyphs = [ None ] * len(fonts)
+    for _ in range(repeat):
+        for i, font in enumerate(fonts):
+            elapsed, glyphs[i] = shape(font, lines, features)
+            if best[i] is None or elapsed < best[i]:
+                best[i] = elapsed
+    return list(zip(best, glyphs))
+
+
+def load_font(path):
+    return hb.Font(hb.Face(hb.Blob.from_file_path(path)))
+
+
+def benchmark(fonts, reference, feature_sets, corpora, repeat):
+    # fonts is a list of (mode, path).  Each result is keyed by
+    # mode/features/corpus, with timings relative to shaping the same text
+    # with the reference (unpatched) font, which mostly cancels out the speed
+    # of the machine.
+    ref_font = load_font(reference) if reference else None
+    results = {}
+    for mode, path in fonts:
+        font = load_font(path)
+        for feature_set in feature_sets:
+            features = { f: True for f in feature_set.split(',') if f }
+            for name, lines in corpora.items():
+                chars = sum(map(len, lines))
+                times = shape_time([ font, ref_font ] if ref_font else [ font ],
+                                   lines, features, repeat)
+                elapsed, glyphs = times[0]
+                result = {
+                    'glyphs_per_sec': glyphs / elapsed,
+                    'ns_per_char': elapsed * 1e9 / chars,
+                    'growth': glyphs / chars,
+                }
+                if ref_font:
+                    result['relative'] = elapsed / times[1][0]
+                results[f'{mode}/{feature_set or "-"}/{name}'] = result
+    return results
+
+
+def print_results(results):
+    print(f'{"mode/features/corpus":<36} {"glyphs/s":>12} {"ns/char":>9}'
+          f' {"growth":>7} {"relative":>8}')
+    for key, r in results.items():
+        relative = f'{r["relative"]:8.2f}' if 'relative' in r else ' ' * 8
+        print(f'{key:<36} {r["glyphs_per_sec"]:12.0f} {r["ns_per_char"]:9.1f}'
+              f' {r["growth"]:7.3f} {relative}')
+
+
+def layout_sizes(fonts):
+    # Layout table bytes and subtable counts for each mode.
+    return { mode: { k: v for k, v in dgstats.layout_stats(path).items()
+                     if k.endswith((' bytes', ' subtables')) }
+             for mode, path in fonts }
+
+
+def print_sizes(sizes, baseline=None):
+    for mode, stats in sizes.items():
+        base = (baseline or {}).get(mode, {})
+        print(f'{mode}:', ', '.join(
+                f'{k} {v}' + (f' ({v - base[k]:+d})' if k in base else '')
+                for k, v in stats.items()))
+
+
+def geomean(values):
+    return math.exp(sum(map(math.log, values)) / len(values))
+
+
+def compare(results, baseline, tolerance):
+    # Output growth is exact, so any increase is a change in the rules.  Time
+    # is noisy, so relative cost is compared as a geometric mean over each
+    # mode and its feature sets, which is steady enough to catch a change in
+    # the lookup design without failing on every hiccup.
+    failures = []
+    ratios = {}
+    for key, r in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if r['growth'] > base['growth'] + 1e-9:
+            failures.append(f'{key}: growth {base["growth"]:.3f}'
+                            f' -> {r["growth"]:.3f}')
+        if 'relative' in r and 'relative' in base:
+            mode, features, _ = key.split('/')
+            ratios.setdefault(mode, {}).setdefault(features, []).append(
+                    r['relative'] / base['relative'])
+    for mode, by_features in ratios.items():
+        for features, values in by_features.items():
+            ratio = geomean(values)
+            print(f'{mode}/{features}: {ratio:.2f}x baseline cost')
+            if ratio > 1 + 2 * tolerance:
+                failures.append(f'{mode}/{features}: relative cost'
+                                f' {ratio:.2f}x baseline')
+        ratio = geomean(sum(by_features.values(), []))
+        print(f'{mode}: {ratio:.2f}x baseline cost')
+        if ratio > 1 + tolerance:
+            failures.append(f'{mode}: relative cost {ratio:.2f}x baseline')
+    return failures
+
+
+def build_fonts(source, modes, backend, tmpdir, **kwargs):
+    import digitgrouper
+    font_id = digitgrouper.faces_in_file(source, backend)[0][0]
+    variants = [ dict(output=os.path.join(tmpdir, mode + '.ttf'), n=0,
+                      options=MODES[mode]) for mode in modes ]
+    options = dict(before=False, gap_size=',')
+    options.update(kwargs)
+    results = digitgrouper.patch_face(font_id, variants, backend, **options)
+    return [ (mode, filename) for mode, (filename, _, _) in zip(modes, results) ]
+
+
+def main(fonts, build, modes, backend, reference, features, corpus, text,
+         repeat, baseline, save_baseline, tolerance, **kwargs):
+    corpora = load_corpora(corpus, text)
+    with contextlib.ExitStack() as stack:
+        if build:
+            tmpdir = stack.enter_context(tempfile.TemporaryDirectory())
+            fonts = build_fonts(build, modes, backend, tmpdir, **kwargs)
+            reference = reference or build
+        else:
+            fonts = [ tuple(f.split('=', 1)) if '=' in f
+                      else (os.path.splitext(os.path.basename(f))[0], f)
+                      for f in fonts ]
+        results = benchmark(fonts, reference, features, corpora, repeat)
+        sizes = layout_sizes(fonts)
+    print_results(results)
+
+    if not baseline:
+        print_sizes(sizes)
+
+    if save_baseline:
+        with open(save_baseline, 'w') as f:
+            json.dump({ 'corpus_version': CORPUS_VERSION,
+                        'results': results, 'sizes': sizes },
+                      f, indent=1, sort_keys=True)
+        print('saved: ', save_baseline)
+    if baseline:
+        with open(baseline) as f:
+            stored = json.load(f)
+        if stored.get('corpus_version') != CORPUS_VERSION:
+            sys.exit(f'{baseline}: made with a different corpus')
+        print_sizes(sizes, stored.get('sizes'))
+        failures = compare(results, stored['results'], tolerance)
+        for failure in failures:
+            print('REGRESSION: ', failure)
+        if failures:
+            sys.exit(f'{len(failures)} regressions against {baseline}')
+        print('no regressions against', baseline)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+            description='Benchmark shaping with patched fonts.')
+    parser.add_argument('fonts', metavar='[mode=]font', nargs='*',
+            help='Patched fonts to benchmark, labelled by mode.')
+    parser.add_argument('--build', metavar='font',
+            help='Patch this font in each mode, and benchmark those.')
+    parser.add_argument('--modes', metavar='mode,...',
+            help=f'Modes to build ({",".join(MODES)}).',
+            type=lambda s: s.split(','), default=list(MODES))
+    parser.add_argument('--backend',
+            help='Backend to build with.',
+            choices=('fontforge', 'fonttools'), default='fonttools')
+    parser.add_argument('--marker-free',
+            help='Build with --marker-free.',
+            default=False, action='store_true')
+    parser.add_argument('--class-contexts',
+            help='Build with --class-contexts.',
+            default=False, action='store_true')
+    parser.add_argument('--single-pinch',
+            help='Build with --single-pinch.',
+            default=False, action='store_true')
+    parser.add_argument('--max-run', metavar='N',
+            help='Build with --max-run N.',
+            type=int, default=None)
+    parser.add_argument('--reference', metavar='font',
+            help='Unpatched font to measure relative cost against.')
+    parser.add_argument('--features', metavar='f,f',
+            help='Feature set to shape with (repeatable; "" for none).',
+            action='append', default=None)
+    parser.add_argument('--corpus', metavar='name,...',
+            help=f'Generated corpora to use ({",".join(CORPORA)}).',
+            type=lambda s: s.split(','), default=list(CORPORA))
+    parser.add_argument('--text', metavar='file',
+            help='Extra corpus, one line of text per shaping call.',
+            action='append', default=[])
+    parser.add_argument('--repeat', metavar='N',
+            help='Take the best of N runs.',
+            type=int, default=5)
+    parser.add_argument('--baseline', metavar='file',
+            help='Fail if results are worse than this stored baseline.')
+    parser.add_argument('--save-baseline', metavar='file',
+            help='Store the results as a baseline.')
+    parser.add_argument('--tolerance', metavar='fraction',
+            help='Allowed increase in relative cost over a mode before failing '
+                 '(twice that for any one feature set).',
+            type=float, default=0.1)
+    args = parser.parse_args()
+    if not args.fonts and not args.build:
+        parser.error('give some fonts, or --build')
+    if args.features is None:
+        args.features = list(FEATURE_SETS)
+    main(**vars(args))
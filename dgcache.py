@@ -0,0 +1,134 @@
+# Content-addressed store of patched fonts, so that re-running over
+# unchanged inputs with unchanged options can skip the patching entirely.
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+SIZE_UNITS = {'k': 1 << 10, 'm': 1 << 20, 'g': 1 << 30, 't': 1 << 40}
+
+
+def parse_size(string):
+    unit = SIZE_UNITS.get(string[-1:].lower())
+    if unit:
+        return int(float(string[:-1]) * unit)
+    return int(string)
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def version_stamp(version, *paths):
+    # The version string alone is too easy to forget to bump, so the source
+    # of the rules is folded in as well.
+    digest = hashlib.sha256(version.encode())
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return f'{version}+{digest.hexdigest()[:16]}'
+
+
+def link_or_copy(src, dst):
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+class OutputCache:
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+        os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def key(**fields):
+        blob = json.dumps(fields, sort_keys=True, default=str)
+        return hashlib.sha256(blob.encode()).hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.path, key[:2], key)
+
+    def fetch(self, key, filename_for):
+        # filename_for() maps the cached metadata to an output filename,
+        # since that can depend on the font's name.
+        entry = self._entry(key)
+        try:
+            with open(entry + '.json') as f:
+                meta = json.load(f)
+            filename = filename_for(meta)
+            link_or_copy(entry + '.font', filename)
+        except (FileNotFoundError, ValueError):
+            return None
+        # mtime is the last-used stamp for eviction
+        with contextlib.suppress(OSError):
+            os.utime(entry + '.font')
+        return filename
+
+    def store(self, key, filename, **meta):
+        entry = self._entry(key)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        # Publish the font before the metadata, and both atomically, so
+        # concurrent workers never see half an entry.
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(entry))
+        os.close(fd)
+        link_or_copy(filename, tmp)
+        os.replace(tmp, entry + '.font')
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(entry))
+        with os.fdopen(fd, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, entry + '.json')
+
+    def fetch_record(self, key):
+        # Small JSON records kept alongside the fonts, like a face's analysis.
+        entry = self._entry(key) + '.record'
+        try:
+            with open(entry) as f:
+                record = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        with contextlib.suppress(OSError):
+            os.utime(entry)
+        return record
+
+    def store_record(self, key, record):
+        entry = self._entry(key)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(entry))
+        with os.fdopen(fd, 'w') as f:
+            json.dump(record, f)
+        os.replace(tmp, entry + '.record')
+
+    def evict(self):
+        entries = []
+        total = 0
+        for dirpath, _, filenames in os.walk(self.path):
+            for name in filenames:
+                base, kind = os.path.splitext(name)
+                if kind not in ('.font', '.record'):
+                    continue
+                with contextlib.suppress(OSError):
+                    st = os.stat(os.path.join(dirpath, name))
+                    entries.append((st.st_mtime, st.st_size,
+                                    os.path.join(dirpath, base), kind))
+                    total += st.st_size
+        entries.sort()
+        evicted = 0
+        for _, size, entry, kind in entries:
+            if total <= self.max_size:
+                break
+            for suffix in ('.json', '.font') if kind == '.font' else (kind,):
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(entry + suffix)
+            total -= size
+            evicted += 1
+        return evicted, total
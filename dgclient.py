@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+# Hand a digitgrouper.py command line to a running dgserver.py and wait for
+# it to finish.  This imports nothing heavy, so it starts up quickly.
+import json
+import os
+import socket
+import sys
+import tempfile
+
+SOCKET = os.environ.get('DIGITGROUPER_SOCKET') or os.path.join(
+        os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir(),
+        'digitgrouper.sock')
+
+
+def request(args, path=SOCKET, job_id=None):
+    # The server's response to one job: a dict with 'status' ('ok' or
+    # 'error'), its 'exit' code, what it printed to 'output' and 'error',
+    # and how many 'seconds' it took.
+    job = { 'id': job_id, 'args': args, 'cwd': os.getcwd() }
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall(json.dumps(job).encode() + b'\n')
+        sock.shutdown(socket.SHUT_WR)
+        with sock.makefile('rb') as f:
+            return json.loads(f.readline())
+
+
+def main(argv):
+    path = SOCKET
+    if argv[:1] == [ '--socket' ]:
+        path, argv = argv[1], argv[2:]
+    result = request(argv, path, os.getpid())
+    sys.stdout.write(result['output'])
+    sys.stderr.write(result['error'])
+    return result['exit']
+
+
+if __name__ == '__main__':
+    # Everything but --socket is passed through to digitgrouper.py as it is,
+    # so this can't use argparse.
+    sys.exit(main(sys.argv[1:]))
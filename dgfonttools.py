@@ -0,0 +1,586 @@
+# A table-level backend built on fontTools.  Rather than round-tripping every
+# outline through fontforge, this loads the font lazily, appends the thsp.*
+# glyphs as references to existing ones, and splices the lookups described
+# in dgrules into the existing GSUB/GPOS.  Tables which aren't touched are
+# written back out exactly as they were read.
+import contextlib
+import copy
+import re
+import struct
+from types import SimpleNamespace
+
+from fontTools.feaLib.builder import addOpenTypeFeaturesFromString
+from fontTools.otlLib.builder import (ChainContextPosBuilder,
+        ChainContextSubstBuilder, ChainContextualRule, ChainContextualRuleset)
+from fontTools.pens.boundsPen import BoundsPen
+from fontTools.pens.t2CharStringPen import T2CharStringPen
+from fontTools.pens.transformPen import TransformPen
+from fontTools.pens.ttGlyphPen import TTGlyphPen
+from fontTools.ttLib import TTFont, TTLibError, newTable
+from fontTools.ttLib.tables import otBase, otTables
+from fontTools.ttLib.tables._g_l_y_f import Glyph
+
+import dgreport
+import dgrules
+from dgrules import Features
+
+GLYPH_CLASS_MARK = 3
+
+
+def faces_in_file(path):
+    with open(path, 'rb') as f:
+        header = f.read(12)
+    if header[:4] == b'ttcf':
+        return list(range(struct.unpack('>L', header[8:12])[0]))
+    return [-1]
+
+
+def open_font(font_id):
+    path, index = font_id
+    # Bounding boxes are left alone so that glyf doesn't have to be unpacked
+    # just to be written out again.  The few glyphs added here set their own.
+    return TTFont(path, fontNumber=index, lazy=True, recalcBBoxes=False)
+
+
+def full_name(font):
+    name = font['name']
+    return name.getDebugName(4) or name.getDebugName(6)
+
+
+def rename_font(font, suffix='DG'):
+    name = font['name']
+    familyname = name.getDebugName(16) or name.getDebugName(1)
+    fontname = name.getDebugName(6) or ''
+    oldname = familyname
+    while oldname not in fontname and ' ' in oldname:
+        # Sometimes things get tangled into the font name that don't belong
+        # there.  Hopefully this can strip those off.
+        oldname = oldname.rsplit(' ', 1)[0]
+    newname = oldname + suffix
+    for record in name.names:
+        with contextlib.suppress(UnicodeDecodeError):
+            string = record.toUnicode()
+            if oldname in string and newname not in string:
+                record.string = string.replace(oldname, newname)
+    if 'CFF ' in font:
+        cff = font['CFF '].cff
+        top = cff.topDictIndex[0]
+        for key in ('FullName', 'FamilyName'):
+            if hasattr(top, key):
+                setattr(top, key, getattr(top, key).replace(oldname, newname))
+        cff.fontNames = [ n.replace(oldname, newname) for n in cff.fontNames ]
+
+
+def generate(font, filename):
+    font.save(filename)
+
+
+def best_cmap(font):
+    # Decompile a private copy, so that the font's own cmap isn't loaded and
+    # gets copied to the output as it was.
+    cmap = newTable('cmap')
+    cmap.decompile(font.reader['cmap'], font)
+    return cmap.getBestCmap()
+
+
+def substitution_index(font):
+    # Map each glyph to the glyphs that any single, alternate or multiple
+    # substitution in the font can turn it into.
+    index = {}
+    if 'GSUB' not in font:
+        return index
+    for lookup in font['GSUB'].table.LookupList.Lookup:
+        for subtable in lookup.SubTable:
+            subtable = getattr(subtable, 'ExtSubTable', subtable)
+            if isinstance(subtable, otTables.SingleSubst):
+                pairs = ((k, [v]) for k, v in subtable.mapping.items())
+            elif isinstance(subtable, otTables.AlternateSubst):
+                pairs = subtable.alternates.items()
+            elif isinstance(subtable, otTables.MultipleSubst):
+                pairs = subtable.mapping.items()
+            else:
+                continue
+            for glyph, results in pairs:
+                index.setdefault(glyph, set()).update(results)
+    return index
+
+
+def glyph_bounds(font, name):
+    if 'glyf' in font:
+        glyph = font['glyf'].glyphs[name]
+        data = getattr(glyph, 'data', None)
+        if data is not None:
+            if not data:
+                return None
+            # the header carries the bounding box, no need to unpack it all
+            return struct.unpack('>4h', data[2:10])
+        if glyph.numberOfContours == 0:
+            return None
+        return glyph.xMin, glyph.yMin, glyph.xMax, glyph.yMax
+    pen = BoundsPen(None)
+    charstring = font['CFF '].cff.topDictIndex[0].CharStrings[name]
+    # draw a copy, so the original keeps its bytecode untouched
+    copy.copy(charstring).draw(pen)
+    return pen.bounds
+
+
+def add_glyphs(font, specs):
+    # specs is a list of (name, source, hshift, width) making each new glyph
+    # a copy of source moved right by hshift, with advance width.
+    if 'fvar' in font:
+        # gvar, HVAR and the rest would need the new glyphs too
+        raise TTLibError('variable fonts are not supported by the fonttools '
+                         'backend')
+    order = font.getGlyphOrder() + [ spec[0] for spec in specs ]
+    hmtx = font['hmtx'].metrics
+    upem = font['head'].unitsPerEm
+    bounds = {}
+
+    if 'glyf' in font:
+        glyf = font['glyf']
+        for name, source, hshift, width in specs:
+            box = glyph_bounds(font, source)
+            if box is None:
+                glyph = Glyph()
+            else:
+                pen = TTGlyphPen(glyf)
+                pen.addComponent(source, (1, 0, 0, 1, hshift, 0))
+                glyph = pen.glyph()
+                box = (box[0] + hshift, box[1], box[2] + hshift, box[3])
+                glyph.xMin, glyph.yMin, glyph.xMax, glyph.yMax = box
+            bounds[name] = box
+            glyf.glyphs[name] = glyph
+        font.setGlyphOrder(order)
+        glyf.setGlyphOrder(order)
+        maxp = font['maxp']
+        if maxp.tableVersion == 0x00010000:
+            maxp.maxComponentElements = max(maxp.maxComponentElements, 1)
+            maxp.maxComponentDepth = max(maxp.maxComponentDepth, 1)
+    elif 'CFF ' in font:
+        cff = font['CFF '].cff
+        top = cff.topDictIndex[0]
+        if hasattr(top, 'ROS'):
+            raise TTLibError('CID-keyed CFF is not supported by the fonttools '
+                             'backend, use fontforge instead')
+        charstrings = top.CharStrings
+        private = top.Private
+        for name, source, hshift, width in specs:
+            if width == private.defaultWidthX:
+                pen = T2CharStringPen(None, None)
+            else:
+                pen = T2CharStringPen(width - private.nominalWidthX, None)
+            copy.copy(charstrings[source]).draw(
+                    TransformPen(pen, (1, 0, 0, 1, hshift, 0)))
+            charstring = pen.getCharString(private, cff.GlobalSubrs)
+            charstrings.charStringsIndex.append(charstring)
+            charstrings.charStrings[name] = len(charstrings.charStringsIndex) - 1
+            box = glyph_bounds(font, source)
+            if box is not None:
+                box = (box[0] + hshift, box[1], box[2] + hshift, box[3])
+            bounds[name] = box
+        font.setGlyphOrder(order)
+        top.charset = order
+    else:
+        raise TTLibError('font has neither glyf nor CFF outlines')
+
+    head = font['head']
+    hhea = font['hhea']
+    for name, source, hshift, width in specs:
+        box = bounds[name]
+        hmtx[name] = (width, box[0] if box else 0)
+        if box:
+            head.xMin = min(head.xMin, box[0])
+            head.xMax = max(head.xMax, box[2])
+            hhea.minLeftSideBearing = min(hhea.minLeftSideBearing, box[0])
+            hhea.minRightSideBearing = min(hhea.minRightSideBearing,
+                                           width - box[2])
+            hhea.xMaxExtent = max(hhea.xMaxExtent, box[2])
+        if 'vmtx' in font:
+            font['vmtx'].metrics[name] = font['vmtx'].metrics[source]
+        if 'hdmx' in font:
+            for ppem, widths in font['hdmx'].hdmx.items():
+                widths[name] = round(width * ppem / upem)
+        if 'LTSH' in font:
+            font['LTSH'].yPels[name] = 1
+
+
+def set_glyph_class(font, names, glyph_class):
+    # Only into a GlyphClassDef the font has already.  A new one listing just
+    # these would stop HarfBuzz taking the classes of every other glyph from
+    # Unicode, so the font's own combining marks would stop attaching.
+    gdef = font.get('GDEF')
+    if gdef is None or gdef.table.GlyphClassDef is None:
+        return
+    for name in names:
+        gdef.table.GlyphClassDef.classDefs[name] = glyph_class
+
+
+def fea_glyph(name):
+    return '\\' + name
+
+
+def fea_class(name):
+    return '@' + name
+
+
+def ordered(glyphs):
+    return glyphs if isinstance(glyphs, list) else sorted(glyphs)
+
+
+def fea_rule(lu_type, kind, rule):
+    # Translate a fontforge coverage rule into feature file syntax.
+    backtrack, match, lookahead = ( part.split() for part in rule.split('|') )
+    backtrack = [ fea_class(t[1:-1]) for t in backtrack ]
+    lookahead = [ fea_class(t[1:-1]) for t in lookahead ]
+    if kind == 'reversecoverage':
+        source, _, target = match
+        return ' '.join(['rsub'] + backtrack + [fea_class(source[1:-1]) + "'"]
+                        + lookahead + ['by', fea_class(target[1:-1])]) + ';'
+    marked = []
+    for t in match:
+        if t.startswith('@<'):
+            marked.append(f'lookup {t[2:-1]}')
+        else:
+            marked.append(fea_class(t[1:-1]) + "'")
+    verb = 'pos' if lu_type.startswith('gpos') else 'sub'
+    return ' '.join([verb] + backtrack + marked + lookahead) + ';'
+
+
+def fea_glyph_rule(lu_type, source, result, adjustment=None):
+    if lu_type == 'gpos_single':
+        return f'pos {fea_glyph(source)} <{adjustment} 0 0 0>;'
+    if lu_type == 'gsub_ligature':
+        components = ' '.join(fea_glyph(g) for g in result)
+        return f'sub {components} by {fea_glyph(source)};'
+    if isinstance(result, str):
+        result = (result,)
+    return f'sub {fea_glyph(source)} by {" ".join(map(fea_glyph, result))};'
+
+
+def new_layout_table(font, tag):
+    table = getattr(otTables, tag)()
+    table.Version = 0x00010000
+    table.ScriptList = otTables.ScriptList()
+    table.ScriptList.ScriptRecord = []
+    table.FeatureList = otTables.FeatureList()
+    table.FeatureList.FeatureRecord = []
+    table.LookupList = otTables.LookupList()
+    table.LookupList.Lookup = []
+    font[tag] = newTable(tag)
+    font[tag].table = table
+
+
+def shift_lookup_indices(obj, start, count):
+    # Renumber every lookup reference at or after start, wherever it is:
+    # contextual lookup records, features and feature variations.
+    if isinstance(obj, list):
+        for item in obj:
+            shift_lookup_indices(item, start, count)
+    elif isinstance(obj, otBase.BaseTable):
+        for key, value in list(vars(obj).items()):
+            if key == 'LookupListIndex':
+                if isinstance(value, list):
+                    obj.LookupListIndex = [ i + count if i >= start else i
+                                            for i in value ]
+                elif value >= start:
+                    obj.LookupListIndex = value + count
+            else:
+                shift_lookup_indices(value, start, count)
+
+
+def langsys_of(table, script_tag):
+    records = table.ScriptList.ScriptRecord
+    for record in records:
+        if record.ScriptTag == script_tag:
+            break
+    else:
+        record = otTables.ScriptRecord()
+        record.ScriptTag = script_tag
+        record.Script = otTables.Script()
+        record.Script.DefaultLangSys = None
+        record.Script.LangSysRecord = []
+        record.Script.LangSysCount = 0
+        records.append(record)
+        records.sort(key=lambda r: r.ScriptTag)
+        table.ScriptList.ScriptCount = len(records)
+    script = record.Script
+    if script.DefaultLangSys is None:
+        langsys = otTables.LangSys()
+        langsys.LookupOrder = None
+        langsys.ReqFeatureIndex = 0xFFFF
+        langsys.FeatureIndex = []
+        langsys.FeatureCount = 0
+        script.DefaultLangSys = langsys
+    return script.DefaultLangSys
+
+
+def add_feature_lookup(table, fourcc, scripts, lookup_index, created):
+    features = table.FeatureList.FeatureRecord
+    for script_tag, _ in scripts:
+        langsys = langsys_of(table, script_tag)
+        for i in langsys.FeatureIndex:
+            if features[i].FeatureTag == fourcc:
+                break
+        else:
+            # one new feature per tag, shared by every script that lacks it
+            i = created.get(fourcc)
+            if i is None:
+                record = otTables.FeatureRecord()
+                record.FeatureTag = fourcc
+                record.Feature = otTables.Feature()
+                record.Feature.FeatureParams = None
+                record.Feature.LookupListIndex = []
+                i = created[fourcc] = len(features)
+                features.append(record)
+            langsys.FeatureIndex.append(i)
+            langsys.FeatureCount = len(langsys.FeatureIndex)
+        feature = features[i].Feature
+        if lookup_index not in feature.LookupListIndex:
+            feature.LookupListIndex = sorted(feature.LookupListIndex
+                                             + [lookup_index])
+            feature.LookupCount = len(feature.LookupListIndex)
+    table.FeatureList.FeatureCount = len(features)
+
+
+def sort_features(table):
+    records = table.FeatureList.FeatureRecord
+    order = sorted(range(len(records)), key=lambda i: records[i].FeatureTag)
+    if order == list(range(len(records))):
+        return
+    remap = { old: new for new, old in enumerate(order) }
+    table.FeatureList.FeatureRecord = [ records[i] for i in order ]
+    for record in table.ScriptList.ScriptRecord:
+        langsyses = [ r.LangSys for r in record.Script.LangSysRecord ]
+        langsyses.append(record.Script.DefaultLangSys)
+        for langsys in langsyses:
+            if langsys is None:
+                continue
+            langsys.FeatureIndex = sorted(remap[i] for i in langsys.FeatureIndex)
+            if langsys.ReqFeatureIndex != 0xFFFF:
+                langsys.ReqFeatureIndex = remap[langsys.ReqFeatureIndex]
+    variations = getattr(table, 'FeatureVariations', None)
+    if variations:
+        for record in variations.FeatureVariationRecord:
+            for sub in record.FeatureTableSubstitution.SubstitutionRecord:
+                sub.FeatureIndex = remap[sub.FeatureIndex]
+
+
+def merge_lookups(font, tag, built, names, features, at_start):
+    # Splice lookups built into a scratch table into the font's own table,
+    # keeping the order they were declared in.
+    if tag not in font:
+        new_layout_table(font, tag)
+    table = font[tag].table
+    lookups = table.LookupList.Lookup
+    at = 0 if at_start else len(lookups)
+    ours = built.LookupList.Lookup
+    if at < len(lookups):
+        font[tag].ensureDecompiled()
+        shift_lookup_indices(table, at, len(ours))
+    shift_lookup_indices(ours, 0, at)
+    lookups[at:at] = ours
+    table.LookupList.LookupCount = len(lookups)
+
+    created = {}
+    for i, name in enumerate(names):
+        for fourcc, scripts in features[name]:
+            add_feature_lookup(table, fourcc, scripts, at + i, created)
+    sort_features(table)
+
+
+def context_subtables(font, tag, ops, classes, lookup_index):
+    # Build a contextual lookup's subtables straight from its plan, a
+    # class-based (format 2) subtable for each merged run and a coverage
+    # (format 3) one for each single rule, in the order dgrules put them.
+    # feaLib would be free to regroup the rules its own way.
+    if tag == 'GPOS':
+        builder = ChainContextPosBuilder(font, None)
+    else:
+        builder = ChainContextSubstBuilder(font, None)
+    def rule_of(rule, glyphs_of):
+        backtrack, match, lookahead = dgrules.parse_rule(rule)
+        return ChainContextualRule(
+                [ glyphs_of(c) for c in backtrack ],
+                [ glyphs_of(c) for c, _ in match ],
+                [ glyphs_of(c) for c in lookahead ],
+                [ [ SimpleNamespace(lookup_index=lookup_index[lookup]) ]
+                  if lookup else None for _, lookup in match ])
+    subtables = []
+    for kind, args in ops:
+        if kind == 'coverage':
+            rule = rule_of(args[0], lambda c: set(classes[c]))
+            subtables.append(builder.buildFormat3Subtable(rule, True))
+            continue
+        class_defs, class_rules = args
+        atoms = { f'{role}{i+1}': set(glyphs)
+                  for role, defs in zip('bmf', class_defs)
+                  for i, glyphs in enumerate(defs) }
+        ruleset = ChainContextualRuleset()
+        for rule in class_rules:
+            ruleset.addRule(rule_of(rule, atoms.__getitem__))
+        subtables.append(builder.buildFormat2Subtable(ruleset,
+                ruleset.format2ClassDefs(), True))
+    return subtables
+
+
+def analyse_face(font, gap_size):
+    # The same record digitgrouper.analyse_face() makes with fontforge.
+    cmap = best_cmap(font)
+    hmtx = font['hmtx'].metrics
+    index = substitution_index(font)
+    def metrics_of(name):
+        if name not in hmtx:
+            return None
+        width, lsb = hmtx[name]
+        bounds = glyph_bounds(font, name)
+        ink = bounds[2] - bounds[0] if bounds else 0
+        return width, lsb, width - lsb - ink
+    return dgrules.FaceAnalysis.gather(len(font.getGlyphOrder()),
+            dgrules.ANALYSED_CHARS + str(gap_size or ''),
+            lambda c: cmap.get(ord(c)), lambda name: index.get(name, ()),
+            metrics_of)
+
+
+def patch_a_font(font, monospace, terminal, before, gap_size, huddle,
+                 class_contexts=False, marker_free=False, dedup_shifts=False,
+                 glyph_budget=dgrules.GLYPH_LIMIT, single_pinch=False,
+                 max_run=None, analysis=None, report=None):
+    # analysis is what analyse_face() found in this face, if that's known
+    # already.
+    report = report or dgreport.Report()
+    if terminal:
+        monospace = True
+
+    with report.phase('analyse'):
+        analysis = analysis or analyse_face(font, gap_size)
+        gap_size = analysis.gap_size(gap_size)
+    existing = analysis.glyph_count
+    print(f'zero: {analysis.width(analysis.cmap["0"])}, gap_size: {gap_size}')
+    with report.phase('plan'):
+        classes, plan, counts, over_budget = dgrules.glyph_plan(
+                lambda basis, alternates: analysis.equivalents(basis,
+                        alternates and not before),
+                monospace, terminal, huddle, marker_free, gap_size,
+                dedup_shifts, existing, glyph_budget, max_run)
+        if single_pinch and not terminal:
+            plan = dgrules.single_class_context(plan, classes, 'pinch_digits')
+        if class_contexts:
+            plan = dgrules.class_contexts(plan, classes)
+            classes = dict(classes)
+    print(f'glyphs: {existing} + {sum(counts.values())}')
+    report.count(glyphs=dict(counts, existing=existing),
+                 over_budget=over_budget,
+                 classes={ k: len(v) for k, v in classes.items() },
+                 **dgrules.plan_counts(plan))
+
+    new_glyphs = []
+    for name, source in () if marker_free else dgrules.MARKERS:
+        source = analysis.cmap.get(source, source)
+        new_glyphs.append((name, source, 0, analysis.width(source)))
+    for name, chars in dgrules.separator_glyphs():
+        source = analysis.first(chars)
+        slide, width = dgrules.separator_shift(name, gap_size, monospace)
+        # the same arithmetic as sliding, and then resizing, the glyph
+        change = analysis.width(source) - width
+        new_glyphs.append((name, source, slide - change // 2, width))
+
+    adjustments = dgrules.adjustments(gap_size)
+
+    # The plan is only written out as feature file text here; feaLib does the
+    # real work of building the lookups below, apart from the class-based
+    # subtables, which are built directly.
+    with report.phase('rules'):
+        lookups = {}
+        contexts = {}
+        for kind, name, *args in plan:
+            if kind in ('lookup', 'glyph_rule'):
+                lookups[name] = (args[0], args[1], [])
+                continue
+            if kind in ('copy', 'shift'):
+                hshift = adjustments[name] if kind == 'shift' else 0
+                for g in sorted(dgrules.class_union(classes, args[0])):
+                    new_glyphs.append((g+'.'+name, g, hshift,
+                                       analysis.width(g)))
+                continue
+            lu_type, _, statements = lookups[name]
+            if kind in ('coverage', 'class'):
+                contexts.setdefault(name, []).append((kind, args))
+            if statements and class_contexts and kind == 'coverage':
+                # keep the rules class_contexts() left unmerged to themselves
+                statements.append('subtable;')
+            if kind == 'sub':
+                for g in sorted(dgrules.class_union(classes, args[0])):
+                    result = dgrules.expand(args[1], g)
+                    statements.append(fea_glyph_rule(lu_type, g, result))
+            elif kind == 'pos':
+                for g in sorted(dgrules.class_union(classes, args[0])):
+                    statements.append(fea_glyph_rule(lu_type, g, None,
+                                                     adjustments[name]))
+            elif kind == 'class':
+                # feaLib only has to get the lookup's type and place right;
+                # its subtables are replaced below
+                class_defs, class_rules = args
+                prefix = f'{name}_{len(contexts[name])}_'
+                atoms = {}
+                for role, defs in zip('bmf', class_defs):
+                    for i, glyphs in enumerate(defs):
+                        atoms[f'{role}{i+1}'] = '{' + prefix + f'{role}{i+1}' + '}'
+                        classes[prefix + f'{role}{i+1}'] = glyphs
+                for rule in class_rules:
+                    statements.append(fea_rule(lu_type, 'coverage',
+                                               rule.format(**atoms)))
+            else:
+                statements.append(fea_rule(lu_type, kind, args[0]))
+
+        fea = []
+        for name, (lu_type, _, statements) in lookups.items():
+            fea.append(f'lookup {name} {{')
+            fea.extend('    ' + s for s in statements)
+            fea.append(f'}} {name};')
+        # Only the classes the rules use; not every variant of every class has
+        # glyphs to go in it.
+        # Lists keep their order, which pairs them up in reverse chaining
+        # rules.
+        used = sorted(set(re.findall(r'@([a-z_0-9]+)', '\n'.join(fea))))
+        fea[:0] = [ f'{fea_class(k)} = [{" ".join(map(fea_glyph, ordered(classes[k])))}];'
+                    for k in used ]
+
+    with report.phase('glyphs'):
+        add_glyphs(font, new_glyphs)
+        if monospace:
+            set_glyph_class(font,
+                    [ name for name, _ in dgrules.separator_glyphs() ],
+                    GLYPH_CLASS_MARK)
+
+    # Build into an empty font with the same glyph order, then move the
+    # results over, so the existing tables never go through feaLib.
+    scratch = TTFont()
+    scratch.setGlyphOrder(font.getGlyphOrder())
+    with report.phase('lookups'):
+        addOpenTypeFeaturesFromString(scratch, '\n'.join(fea),
+                                      tables={'GSUB', 'GPOS'})
+    for tag in ('GSUB', 'GPOS'):
+        names = [ name for name, (lu_type, _, _) in lookups.items()
+                  if lu_type.startswith(tag.lower()) ]
+        if not names:
+            continue
+        index = { name: i for i, name in enumerate(names) }
+        with report.phase('lookups'):
+            for name in names:
+                ops = contexts.get(name, ())
+                if not any( kind == 'class' for kind, _ in ops ):
+                    continue
+                lookup = scratch[tag].table.LookupList.Lookup[index[name]]
+                lookup.LookupType = 8 if tag == 'GPOS' else 6
+                lookup.SubTable = context_subtables(scratch, tag, ops,
+                                                    classes, index)
+                lookup.SubTableCount = len(lookup.SubTable)
+        features = { name: Features.get(lookups[name][1]) for name in names }
+        # GSUB lookups follow any existing ones unless told otherwise, while
+        # GPOS lookups always go first, as fontforge places them.
+        at_start = tag == 'GPOS' or before
+        with report.phase('merge'):
+            merge_lookups(font, tag, scratch[tag].table, names, features,
+                          at_start)
+
+    return font
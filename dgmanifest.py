@@ -0,0 +1,59 @@
+# A record of which faces of a batch have been patched, with what options
+# and to what output, so an interrupted (or partly failed) run can carry on
+# where it left off.  It's a file of JSON lines, appended to as each face
+# finishes, where later lines for the same face replace earlier ones.
+import contextlib
+import json
+
+import dgcache
+
+
+class Manifest:
+    def __init__(self, path, options):
+        # options as they'd come back out of the file, for comparison
+        self.options = json.loads(json.dumps(options, sort_keys=True,
+                                             default=str))
+        self.entries = {}
+        text = ''
+        with contextlib.suppress(FileNotFoundError):
+            with open(path) as f:
+                text = f.read()
+        for line in text.splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # cut short by an interruption
+                continue
+            self.entries[(entry['file'], entry['face'])] = entry
+        self.file = open(path, 'a')
+        if text and not text.endswith('\n'):
+            self.file.write('\n')
+
+    def done(self, file, face):
+        # Whether the face was patched with the same options, to an output
+        # which is still there and unchanged.
+        entry = self.entries.get((file, face))
+        if not entry or entry['status'] != 'done' \
+                or entry['options'] != self.options:
+            return False
+        try:
+            return dgcache.file_digest(entry['output']) == entry['output_hash']
+        except OSError:
+            return False
+
+    def record(self, file, face, output=None, error=None):
+        entry = {
+            'file': file,
+            'face': face,
+            'options': self.options,
+            'status': 'failed' if error else 'done',
+            'output': output,
+            'output_hash': dgcache.file_digest(output) if output else None,
+            'error': error,
+        }
+        self.entries[(file, face)] = entry
+        self.file.write(json.dumps(entry) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
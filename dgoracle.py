@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+# A plain-string model of the grouping rules in dgrules.lookup_plan(), to
+# check the rules against without shaping anything, and a harness which
+# compares it with what HarfBuzz does with a patched font.
+#
+# The model follows the lookups pass by pass: capture_as_hex (dghx),
+# comma_as_decimal (dgdc) and capture_numbers classify digits; then groups
+# of three and four are counted off from the right, and groups of five from
+# the left.  A digit is only ever classified once, and only runs of four or
+# more hex digits can be classified, so only those are visited.  With
+# max_run, a run of hex digits longer than that is avoided from its start
+# wherever a rule could begin classifying it.
+import argparse
+import bisect
+import functools
+import itertools
+import multiprocessing
+import random
+import re
+import sys
+import time
+
+import dgrules
+
+DEC = frozenset(dgrules.DECIMAL_LIST)
+HEX = frozenset(dgrules.HEXADECIMAL_LIST)
+XX = frozenset('bBoOxX')
+
+GROUPING_FEATURES = frozenset(dgrules.Features._MAP[dgrules.Features.ALL])
+SEPARATOR_FEATURES = (('dgco', 'comma'), ('dgap', 'apostrophe'),
+                      ('dgdo', 'dot'))
+
+CAP3, CAP4, CAP5, AVOID = 3, 4, 5, 1
+
+_RUN = re.compile('[0-9A-Fa-f]{4,}')
+_NOT_DEC = re.compile('[^0-9]')
+_NOT_HEX = re.compile('[^0-9A-Fa-f]')
+_GROUPS = re.compile(rb'\x03+|\x04+|\x05+')
+# Runs starting right after a comma or dot, the only ones comma_as_decimal
+# can classify.
+_AFTER_SEP = re.compile('(?<=[,.])[0-9][0-9A-Fa-f]{3,}')
+# Every digit that capture_numbers could classify, from what's around it;
+# _capture() decides whether it really does.
+_CAPTURE = ( '[0-9]{5}|(?<=#)[0-9A-Fa-f]{6}|(?<=\\.)[0-9]{4}'
+             '|(?<=0[bBoOxX])[0-9A-Fa-f]{5}' )
+
+
+@functools.lru_cache(maxsize=None)
+def _candidates(max_run):
+    # with max_run, any digit with more than max_run following it too
+    pattern = _CAPTURE + (f'|[0-9A-Fa-f]{{{max_run + 1}}}' if max_run else '')
+    return re.compile(pattern)
+
+
+def classify(text, hexadecimal=False, decimal_comma=False, max_run=None):
+    # The classification of each character, 0 for none.  Whenever a rule
+    # looks ahead, the digits it looks at haven't been classified yet, so
+    # only the run of hex digits it's in needs checking.  Regular
+    # expressions find the few digits that any rule could start classifying
+    # at, so that only those are visited.
+    cls = bytearray(len(text))
+
+    if hexadecimal:
+        # every hex digit with four more following it, and then the rest
+        # of its run carries on from there
+        for m in _RUN.finditer(text):
+            s, e = m.span()
+            if max_run and e - s > max_run:
+                cls[s:e] = bytes([AVOID]) * (e - s)
+            elif e - s > 4:
+                cls[s:e] = bytes([CAP4]) * (e - s)
+
+    if decimal_comma:
+        # only the first digit of a run can follow a comma or dot, and each
+        # is decided before any are carried on through their runs
+        starts = [ (m.start(), m.end(), _decimal_comma(text, cls, *m.span(),
+                                                       max_run))
+                   for m in _AFTER_SEP.finditer(text) if not cls[m.start()] ]
+        for s, e, p in starts:
+            _spread(text, cls, s, e, p)
+
+    # Candidates can overlap, so each search starts just after the last
+    # one, or past whatever it classified.
+    search = _candidates(max_run).search
+    m = search(text)
+    while m:
+        i = m.start()
+        pos = i + 1
+        if not cls[i]:
+            m = _NOT_HEX.search(text, i)
+            e = m.start() if m else len(text)
+            if i and cls[i-1]:
+                # a hex letter after a decimal classification, which can
+                # still start a run that's too long
+                if max_run and i + max_run < e:
+                    cls[i:e] = bytes([AVOID]) * (e - i)
+                    pos = e
+            else:
+                pos = max(pos, _spread(text, cls, i, e,
+                                       _capture(text, cls, i, e, max_run)))
+        m = search(text, pos)
+    return cls
+
+
+def _spread(text, cls, i, e, p):
+    # Classify text[i] as p, and continue the classification as far as it
+    # goes; returns where it stopped.
+    if not p:
+        return i
+    end = e
+    if p in (CAP3, CAP5):
+        m = _NOT_DEC.search(text, i, e)
+        end = m.start() if m else e
+    cls[i:end] = bytes([p]) * (end - i)
+    return end
+
+
+def _plain(text, cls, i, chars):
+    return i >= 0 and not cls[i] and text[i] in chars
+
+
+def _decimals(text, i, e, count):
+    return i + count < e and text[i+1:i+count+1].isdigit()
+
+
+def _decimal_comma(text, cls, i, e, max_run=None):
+    # The first comma_as_decimal rule to match the digit at the start of a
+    # run.
+    if text[i] not in DEC:
+        return 0
+    after_digit = _plain(text, cls, i-2, DEC) or (i >= 2 and cls[i-2] == CAP3)
+    if _plain(text, cls, i-1, ','):
+        if max_run and i + max_run < e:
+            return AVOID
+        if after_digit and _decimals(text, i, e, 4):
+            return CAP5
+        if _decimals(text, i, e, 3):
+            return AVOID
+    elif _plain(text, cls, i-1, '.') and after_digit \
+            and _decimals(text, i, e, 3):
+        return AVOID
+    return 0
+
+
+def _capture(text, cls, i, e, max_run=None):
+    # The first capture_numbers rule to match an unclassified digit which
+    # doesn't follow a classified one.
+    if max_run and i + max_run < e:
+        return AVOID
+    c = text[i]
+    q = text[i-1] if i > 0 else ''
+    if q == '#':
+        if c in DEC and _decimals(text, i, e, 6):
+            return CAP3
+        if i + 5 < e:
+            return AVOID
+    elif q == '.' and c in DEC:
+        if _plain(text, cls, i-2, '.') and _decimals(text, i, e, 4):
+            return CAP3
+        if (_plain(text, cls, i-2, DEC) or (i >= 2 and cls[i-2] == CAP3)) \
+                and _decimals(text, i, e, 4):
+            return CAP5
+        if _decimals(text, i, e, 3):
+            return AVOID
+    elif q in XX and _plain(text, cls, i-2, '0') and i + 4 < e:
+        return CAP4
+    if c in DEC and _decimals(text, i, e, 4):
+        return CAP3
+    return 0
+
+
+def separators(text, features, max_run=None):
+    # [(index, glyph)] for each separator glyph following text[index], where
+    # glyph is the name of the separator without its 'thsp.' prefix.
+    return separators_batch([ text ], features, max_run)[0]
+
+
+def separators_batch(texts, features, max_run=None):
+    # separators() for many strings at once.  Nothing looks past a newline,
+    # so they're classified as one string, which is much quicker than one at
+    # a time.
+    features = set(features)
+    if not features & GROUPING_FEATURES:
+        return [ [] for _ in texts ]
+    kind = next(( k for f, k in SEPARATOR_FEATURES if f in features ), 'sep')
+    joined = '\n'.join(texts)
+    cls = classify(joined, 'dghx' in features, 'dgdc' in features, max_run)
+    starts = list(itertools.accumulate(( len(t) + 1 for t in texts ),
+                                       initial=0))
+    names = { size: f'{kind}{size}' for size in (CAP3, CAP4, CAP5) }
+    result = [ [] for _ in texts ]
+    for m in _GROUPS.finditer(cls):
+        a, b = m.span()
+        line = bisect.bisect_right(starts, a) - 1
+        start = starts[line]
+        size = cls[a]
+        name = names[size]
+        if size == CAP5:
+            positions = range(a + 4 - start, b - 1 - start, 5)
+        else:
+            positions = range((b - 1 - a) % size + a - start, b - 1 - start,
+                              size)
+        result[line].extend( (j, name) for j in positions )
+    return result
+
+
+def render(text, seps, mark='_'):
+    out = list(text)
+    for i, _ in reversed(seps):
+        out.insert(i + 1, mark)
+    return ''.join(out)
+
+
+# Differential harness
+
+LEAKS = ( tuple(name for name, _ in dgrules.MARKERS),
+          tuple('.' + suffix for _, _, suffix in dgrules.DIGIT_VARIANTS) )
+
+NO_LIGATURES = { 'liga': False, 'clig': False }
+
+_font = None
+
+
+def _load_font(path):
+    global _font
+    import uharfbuzz as hb
+    _font = hb.Font(hb.Face(hb.Blob.from_file_path(path)))
+
+
+def shaped_separators(text, features):
+    # The same as separators(), from shaping text, and whether any glyphs
+    # which should have been cleaned up were left behind.
+    import uharfbuzz as hb
+    buf = hb.Buffer()
+    buf.add_codepoints([ ord(c) for c in text ])
+    buf.guess_segment_properties()
+    # the font's own ligatures (eg. ff) would break up runs of hex digits
+    hb.shape(_font, buf, dict(NO_LIGATURES, **{ f: True for f in features }))
+    seps = []
+    leaked = False
+    for info in buf.glyph_infos:
+        name = _font.glyph_to_string(info.codepoint)
+        if name.startswith(LEAKS[0]) or name.endswith(LEAKS[1]):
+            leaked = True
+        elif name.startswith('thsp.'):
+            seps.append((info.cluster, name[5:]))
+    return sorted(seps), leaked
+
+
+def _check(job):
+    features, texts, max_run = job
+    mismatches = []
+    for text, expected in zip(texts, separators_batch(texts, features,
+                                                      max_run)):
+        actual, leaked = shaped_separators(text, features)
+        if leaked or actual != expected:
+            mismatches.append((features, text, expected, actual, leaked))
+    return len(texts), mismatches
+
+
+TOKENS = ( list('0123456789') * 6 + list('abcdefABCDEF') + list('xXbBoO#.,')
+           + [ ' ', ' ', '..', '0x', '0b', '#', 'z', '-' ] )
+
+
+def random_text(rng):
+    return ''.join(rng.choice(TOKENS) for _ in range(rng.randrange(1, 40)))
+
+
+def generate(count, seed, chunk):
+    rng = random.Random(seed)
+    for start in range(0, count, chunk):
+        yield [ random_text(rng) for _ in range(min(chunk, count - start)) ]
+
+
+def main(font, features, count, seed, jobs, text, show, speed, max_run):
+    feature_sets = [ tuple(f for f in fs.split(',') if f) for fs in features ]
+    if text:
+        with open(text, encoding='utf-8') as f:
+            batches = [ f.read().splitlines() ]
+    else:
+        batches = list(generate(count, seed, 1000))
+
+    if speed:
+        n = sum(map(len, batches))
+        for fs in feature_sets:
+            start = time.perf_counter()
+            for batch in batches:
+                separators_batch(batch, fs, max_run)
+            elapsed = time.perf_counter() - start
+            print(f'{",".join(fs)}: {n / elapsed:.0f} strings/sec')
+    if not font:
+        return
+
+    jobs_list = [ (fs, batch, max_run) for fs in feature_sets
+                  for batch in batches ]
+    checked = 0
+    failures = []
+    with multiprocessing.Pool(jobs or None, _load_font, (font,)) as pool:
+        for n, mismatches in pool.imap_unordered(_check, jobs_list):
+            checked += n
+            failures.extend(mismatches)
+    for fs, t, expected, actual, leaked in failures[:show]:
+        print(f'{",".join(fs)}: {t!r}')
+        print('    oracle: ', render(t, expected), expected)
+        print('    shaped: ', render(t, actual), actual,
+              '(left markers behind)' if leaked else '')
+    print(f'{checked} checked, {len(failures)} mismatches')
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+            description='Compare a plain-string model of digit grouping with '
+                        'the shaping of a patched font.')
+    parser.add_argument('font', nargs='?',
+            help='Patched font to shape with (omit to only run the model).')
+    parser.add_argument('--features', metavar='f,f',
+            help='Feature set to check (repeatable).',
+            action='append', default=None)
+    parser.add_argument('-n', '--count', metavar='N',
+            help='Number of random strings to check for each feature set.',
+            type=int, default=100000)
+    parser.add_argument('--seed',
+            help='Seed for the random strings.',
+            type=int, default=0)
+    parser.add_argument('-j', '--jobs', metavar='N',
+            help='Worker processes (0: one per CPU).',
+            type=int, default=0)
+    parser.add_argument('--text', metavar='file',
+            help='Check the lines of this file instead of random strings.')
+    parser.add_argument('--show', metavar='N',
+            help='Print up to N mismatches.',
+            type=int, default=20)
+    parser.add_argument('--max-run', metavar='N',
+            help='Model a font patched with --max-run N.',
+            type=int, default=None)
+    parser.add_argument('--speed',
+            help='Report how fast the model runs on its own.',
+            default=False, action='store_true')
+    args = parser.parse_args()
+    if args.features is None:
+        args.features = [ 'dgsp', 'dgco', 'dghx,dgsp', 'dgdc,dgsp' ]
+    main(**vars(args))
@@ -0,0 +1,48 @@
+# Cut a patched font down to the characters the digit grouping rules look
+# at, for pages to layer over the original font with unicode-range.
+import os
+
+from fontTools import subset
+from fontTools.ttLib import TTFont
+
+import dgrules
+
+OVERLAY_CHARS = dgrules.HEXADECIMAL_LIST + '.,#xXbBoO'
+
+FLAVORS = { '.woff2': 'woff2', '.woff': 'woff' }
+
+
+def unicode_range(chars=OVERLAY_CHARS):
+    # The CSS unicode-range covering chars.
+    ranges = []
+    for c in sorted(set(map(ord, chars))):
+        if ranges and ranges[-1][1] == c - 1:
+            ranges[-1][1] = c
+        else:
+            ranges.append([ c, c ])
+    return ', '.join( f'U+{a:X}' if a == b else f'U+{a:X}-{b:X}'
+                      for a, b in ranges )
+
+
+def make_overlay(filename):
+    # Rewrite filename in place, compressed according to its extension.
+    # Everything the rules can turn those characters into comes along with
+    # them, and every feature is kept, so that the page can still turn the
+    # grouping on.
+    font = TTFont(filename)
+    options = subset.Options()
+    options.layout_features = [ '*' ]
+    options.name_IDs = [ '*' ]
+    options.name_languages = [ '*' ]
+    options.notdef_outline = True
+    # dgoracle.py and anything else looking for the thsp.* glyphs need them
+    # by name
+    options.glyph_names = True
+    options.drop_tables += [ 'FFTM' ]
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=[ ord(c) for c in OVERLAY_CHARS ],
+            glyphs=[ g for g in font.getGlyphOrder() if g.startswith('thsp.') ])
+    subsetter.subset(font)
+    font.flavor = FLAVORS.get(os.path.splitext(filename)[1].lower())
+    font.save(filename)
+    font.close()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# Print the plan of lookups and rules a font would be patched with, for a
+# set of options, without opening (or needing) a font.  This is the same
+# plan dgrules.compiled_plan() hands to every face patched with those
+# options; only the glyphs in each {class} change from one face to the next.
+import argparse
+
+import dgrules
+
+
+def describe(op):
+    kind, name, *args = op
+    if kind in ('lookup', 'glyph_rule'):
+        lu_type, which = args
+        return f'{kind} {name} {lu_type} ({which or "no feature"})'
+    if kind == 'sub':
+        classes, result = args
+        if isinstance(result, tuple):
+            result = ' '.join(result)
+        return f'  sub {" ".join(classes)} -> {result}'
+    if kind in ('pos', 'shift', 'copy'):
+        return f'  {kind} {name}: {" ".join(args[0])}'
+    return f'  {kind}: {args[0]}'
+
+
+def main(monospace, terminal, huddle, marker_free, dedup_shifts, gap_size,
+         max_run):
+    if dedup_shifts and not gap_size:
+        raise SystemExit('--dedup-shifts needs a --gap-size')
+    suffixes = dgrules.shift_suffixes(gap_size or 0, dedup_shifts)
+    plan = dgrules.compiled_plan(monospace, terminal, huddle, marker_free,
+                                 tuple(suffixes.items()), max_run)
+    for op in plan:
+        print(describe(op))
+    print()
+    if gap_size:
+        used = { name for kind, name, *_ in plan
+                 if kind in ('pos', 'glyph_rule') }
+        for name, offset in dgrules.adjustments(gap_size).items():
+            if name in used:
+                shared = f' (as {suffixes[name]})' \
+                         if terminal and suffixes[name] != name else ''
+                print(f'{name}: {offset:+d}{shared}')
+        print()
+    for key, value in dgrules.plan_counts(plan).items():
+        print(f'{key}: {value}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+            description='Print the rules digitgrouper.py would add, '
+                        'without a font.')
+    parser.add_argument('--monospace', default=False, action='store_true')
+    parser.add_argument('--terminal', default=False, action='store_true')
+    parser.add_argument('--huddle', default=False, action='store_true')
+    parser.add_argument('--marker-free', default=False, action='store_true')
+    parser.add_argument('--dedup-shifts', default=False, action='store_true')
+    parser.add_argument('--gap-size', metavar='N',
+            help='Show what each adjustment moves digits by, for this gap.',
+            type=int, default=None)
+    parser.add_argument('--max-run', metavar='N',
+            help='Leave runs of more than N digits ungrouped.',
+            type=int, default=None)
+    main(**vars(parser.parse_args()))
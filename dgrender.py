@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# Render the strings from test.html with patched fonts, using HarfBuzz to
+# shape and to rasterise, and compare the pictures with stored golden images
+# so what test.html shows in a browser can be checked without one.  Each
+# font and feature set (one per font-* class in test.html) makes one image,
+# and they're rendered across all CPUs.
+#
+# Small differences in anti-aliasing are forgiven by blurring both images a
+# little before comparing, and only pixels which still differ by more than
+# --threshold count; more than --tolerance of those and the image fails.
+import argparse
+import contextlib
+import html
+import multiprocessing
+import os
+import re
+import sys
+import tempfile
+
+import dgbench
+
+TEST_HTML = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'test.html')
+
+
+def _feature_settings(value):
+    features = {}
+    for setting in value.split(','):
+        setting = setting.strip()
+        if setting:
+            features[setting.strip('-"')] = not setting.startswith('-')
+    return features
+
+
+def load_cases(path=TEST_HTML):
+    # {class: (features, lines)} for each font-* class, with the lines of
+    # every div of that class followed by the table each class is shown in.
+    with open(path, encoding='utf-8') as f:
+        page = f.read()
+    styles = re.findall(r'\.font-([\w-]+)\s*{[^}]*font-feature-settings:'
+                        r'\s*([^;]*);', page)
+    table = re.search(r'\.test-table:after\s*{\s*content:(.*?);\s*}', page,
+                      re.S)
+    table = [ html.unescape(line.strip()) for line in
+              ''.join(re.findall(r'"([^"]*)"', table.group(1))).split(r'\a') ]
+    cases = {}
+    for name, settings in styles:
+        lines = []
+        for text in re.findall(rf'<div class="font-{name}">(.*?)<br/>', page,
+                               re.S):
+            lines.append(' '.join(html.unescape(text).split()))
+        cases[name] = (_feature_settings(settings), lines + table)
+    return cases
+
+
+class Image:
+    def __init__(self, width, height, pixels):
+        self.width = width
+        self.height = height
+        self.pixels = pixels  # bytes, rows top to bottom
+
+    @classmethod
+    def load(cls, path):
+        # binary PGM, as written by save()
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, width, height, depth, pixels = data.split(maxsplit=4)
+        if magic != b'P5' or depth != b'255':
+            raise ValueError(f'{path}: not an 8-bit PGM')
+        return cls(int(width), int(height), pixels[:int(width) * int(height)])
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'P5\n%d %d\n255\n' % (self.width, self.height))
+            f.write(self.pixels)
+
+    def rows(self, width=None, height=None):
+        # padded out to width x height with blank pixels
+        w = self.width
+        width = width or w
+        rows = [ self.pixels[y * w:(y + 1) * w].ljust(width, b'\0')
+                 for y in range(self.height) ]
+        return rows + [ bytes(width) ] * ((height or self.height) - self.height)
+
+
+_fonts = {}
+
+
+def _load_font(path, size):
+    import uharfbuzz as hb
+    if path not in _fonts:
+        font = hb.Font(hb.Face(hb.Blob.from_file_path(path)))
+        font.scale = (size * 64, size * 64)
+        _fonts[path] = font
+    return _fonts[path]
+
+
+def render(path, features, lines, size):
+    import uharfbuzz as hb
+    font = _load_font(path, size)
+    extents = font.get_font_extents('ltr')
+    line_height = (extents.ascender - extents.descender + 63) // 64
+    shaped = []
+    for line in lines:
+        buf = hb.Buffer()
+        buf.add_str(line)
+        buf.guess_segment_properties()
+        hb.shape(font, buf, features)
+        shaped.append(buf)
+    width = max(( sum(p.x_advance for p in buf.glyph_positions)
+                  for buf in shaped ), default=0) // 64 + 2
+    height = line_height * len(lines)
+
+    raster = hb.RasterDraw()
+    for row, buf in enumerate(shaped):
+        x = 64
+        y = -extents.descender + (len(lines) - row - 1) * line_height * 64
+        for info, pos in zip(buf.glyph_infos, buf.glyph_positions):
+            raster.transform = (1 / 64, 0, 0, 1 / 64,
+                                (x + pos.x_offset) / 64,
+                                (y + pos.y_offset) / 64)
+            raster.draw_glyph(font, info.codepoint)
+            x += pos.x_advance
+    raster.extents = hb.RasterExtents(0, 0, width, height, 0)
+    image = raster.render()
+    stride = image.extents.stride
+    buffer = image.buffer
+    pixels = b''.join(buffer[y * stride:y * stride + width]
+                      for y in reversed(range(height)))
+    return Image(width, height, pixels)
+
+
+def _blur(image, width, height):
+    # 3x3 box sums, so a glyph edge moving by a fraction of a pixel doesn't
+    # look like a difference.
+    sums = []
+    for row in image.rows(width, height):
+        padded = [ 0, *row, 0 ]
+        sums.append([ a + b + c for a, b, c in
+                      zip(padded, padded[1:], padded[2:]) ])
+    zero = [ 0 ] * width
+    padded = [ zero, *sums, zero ]
+    return [ [ a + b + c for a, b, c in zip(*rows) ]
+             for rows in zip(padded, padded[1:], padded[2:]) ]
+
+
+def compare(actual, golden, threshold):
+    # The fraction of pixels which differ by more than threshold after
+    # blurring, and an image of where.  Images of different sizes are
+    # compared as if the smaller were padded out with blank pixels.
+    if (actual.width, actual.height, actual.pixels) \
+            == (golden.width, golden.height, golden.pixels):
+        return 0.0, None
+    width = max(actual.width, golden.width)
+    height = max(actual.height, golden.height)
+    limit = threshold * 9
+    diff = bytearray()
+    for a, g in zip(_blur(actual, width, height),
+                    _blur(golden, width, height)):
+        diff.extend(255 if abs(x - y) > limit else 0 for x, y in zip(a, g))
+    return diff.count(255) / max(len(diff), 1), Image(width, height,
+                                                      bytes(diff))
+
+
+def _check(job):
+    label, path, name, features, lines, size, golden, save, out, \
+            threshold, tolerance = job
+    image = render(path, features, lines, size)
+    golden_path = os.path.join(golden, label, name + '.pgm')
+    if save:
+        image.save(golden_path)
+        return label, name, None
+    try:
+        stored = Image.load(golden_path)
+    except FileNotFoundError:
+        return label, name, 'no golden image'
+    differs, diff = compare(image, stored, threshold)
+    if differs <= tolerance:
+        return label, name, None
+    if out:
+        image.save(os.path.join(out, label, name + '.pgm'))
+        diff.save(os.path.join(out, label, name + '.diff.pgm'))
+    return label, name, f'{differs:.2%} of pixels differ'
+
+
+def build_fonts(sources, modes, backend, tmpdir, **kwargs):
+    fonts = []
+    for source in sources:
+        family = os.path.splitext(os.path.basename(source))[0]
+        outdir = os.path.join(tmpdir, family)
+        os.makedirs(outdir, exist_ok=True)
+        fonts.extend((f'{family}/{mode}', path) for mode, path in
+                     dgbench.build_fonts(source, modes, backend, outdir,
+                                         **kwargs))
+    return fonts
+
+
+def main(fonts, build, modes, backend, golden, save_golden, out, size,
+         threshold, tolerance, jobs, test, **kwargs):
+    cases = load_cases(test)
+    with contextlib.ExitStack() as stack:
+        if build:
+            tmpdir = stack.enter_context(tempfile.TemporaryDirectory())
+            fonts = build_fonts(build, modes, backend, tmpdir, **kwargs)
+        else:
+            fonts = [ tuple(f.split('=', 1)) if '=' in f
+                      else (os.path.splitext(os.path.basename(f))[0], f)
+                      for f in fonts ]
+        job_list = [ (label, path, name, features, lines, size, golden,
+                      save_golden, out, threshold, tolerance)
+                     for label, path in fonts
+                     for name, (features, lines) in cases.items() ]
+        failures = []
+        with multiprocessing.Pool(jobs or None) as pool:
+            for label, name, error in pool.imap_unordered(_check, job_list):
+                if error:
+                    failures.append(f'{label}/{name}: {error}')
+    if save_golden:
+        print('saved: ', golden, f'({len(job_list)} images)')
+        return
+    for failure in sorted(failures):
+        print('FAILED: ', failure)
+    print(f'{len(job_list)} images, {len(failures)} differ from', golden)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+            description='Render test.html strings with patched fonts and '
+                        'compare them with golden images.')
+    parser.add_argument('fonts', metavar='[label=]font', nargs='*',
+            help='Patched fonts to render, labelled by mode.')
+    parser.add_argument('--build', metavar='font',
+            help='Patch this font in each mode, and render those '
+                 '(repeatable).',
+            action='append', default=None)
+    parser.add_argument('--modes', metavar='mode,...',
+            help=f'Modes to build ({",".join(dgbench.MODES)}).',
+            type=lambda s: s.split(','), default=list(dgbench.MODES))
+    parser.add_argument('--backend',
+            help='Backend to build with.',
+            choices=('fontforge', 'fonttools'), default='fonttools')
+    parser.add_argument('--marker-free',
+            help='Build with --marker-free.',
+            default=False, action='store_true')
+    parser.add_argument('--max-run', metavar='N',
+            help='Build with --max-run N.',
+            type=int, default=None)
+    parser.add_argument('--golden', metavar='dir',
+            help='Where the golden images are kept.',
+            default='golden')
+    parser.add_argument('--save-golden',
+            help='Write the images as the new golden images.',
+            default=False, action='store_true')
+    parser.add_argument('--out', metavar='dir',
+            help='Write images which differ, and where, in here.',
+            default=None)
+    parser.add_argument('--size', metavar='px',
+            help='Pixels per em.',
+            type=int, default=24)
+    parser.add_argument('--threshold', metavar='N',
+            help='How far apart (0-255) blurred pixels must be to differ.',
+            type=int, default=32)
+    parser.add_argument('--tolerance', metavar='fraction',
+            help='Fraction of pixels which may differ.',
+            type=float, default=0.001)
+    parser.add_argument('-j', '--jobs', metavar='N',
+            help='Worker processes (0: one per CPU).',
+            type=int, default=0)
+    parser.add_argument('--test', metavar='file',
+            help='Page to take the strings and feature sets from.',
+            default=TEST_HTML)
+    args = parser.parse_args()
+    if not args.fonts and not args.build:
+        parser.error('give some fonts, or --build')
+    main(**vars(args))
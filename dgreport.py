@@ -0,0 +1,74 @@
+# Where the time and memory go while patching a face, and what it made, for
+# --report.
+import contextlib
+import resource
+import sys
+import time
+
+
+def peak_rss():
+    # High-water mark of this process, in bytes.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def reset_peak_rss():
+    # Start a new high-water mark, which Linux allows through clear_refs;
+    # returns a function reading it, or None where that can't be done.
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        return None
+    return _vm_hwm
+
+
+def _vm_hwm():
+    with contextlib.suppress(OSError):
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    return None
+
+
+class Report:
+    def __init__(self):
+        self.phases = {}
+        self.counts = {}
+        # the peak so far of each phase that's running, outermost first
+        self.running = []
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        # A phase entered more than once adds up its time and keeps the
+        # highest peak.  Where the high-water mark can be reset, peak_rss is
+        # the most memory the process used during the phase; elsewhere only
+        # how far the process's high-water mark rose is known, as
+        # peak_rss_growth.
+        if self.running:
+            self.running[-1] = max(self.running[-1], _vm_hwm() or 0)
+        before = peak_rss()
+        read_peak = reset_peak_rss()
+        self.running.append(0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry = self.phases.setdefault(name, { 'seconds': 0.0 })
+            entry['seconds'] += time.perf_counter() - start
+            reached = self.running.pop()
+            if read_peak:
+                peak = max(reached, read_peak() or 0)
+                entry['peak_rss'] = max(entry.get('peak_rss', 0), peak)
+                if self.running:
+                    self.running[-1] = max(self.running[-1], peak)
+            else:
+                entry['peak_rss_growth'] = max(
+                        entry.get('peak_rss_growth', 0), peak_rss() - before)
+
+    def count(self, **counts):
+        self.counts.update(counts)
+
+    def as_dict(self):
+        return dict(self.counts, phases=self.phases)
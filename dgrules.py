@@ -0,0 +1,855 @@
+# Backend-neutral description of the digit grouping rules.  The lookups are
+# written out once, here, as a plan of operations which each backend
+# (fontforge in digitgrouper.py, fontTools in dgfonttools.py) replays
+# against its own idea of a font.
+import contextlib
+import functools
+import itertools
+import re
+
+DECIMAL_LIST = '0123456789'
+HEXADECIMAL_LIST = '0123456789abcdefABCDEF'
+
+SCRIPTS = (
+    ('DFLT',('dflt')),
+    ('latn',('dflt')),
+    ('cyrl',('dflt')),
+    ('grek',('dflt')),
+    ('kana',('dflt'))
+)
+MAIN_FEATURE = ('dgsp', SCRIPTS)
+COMMA_FEATURE = ('dgco', SCRIPTS)
+APSTR_FEATURE = ('dgap', SCRIPTS)
+DOT_FEATURE = ('dgdo', SCRIPTS)
+ALWAYS_ON_FEATURE = ('calt', SCRIPTS)
+ALL_MODES = (MAIN_FEATURE, COMMA_FEATURE, APSTR_FEATURE, DOT_FEATURE)
+HEXADECIMAL_MODE = (('dghx', SCRIPTS),)
+DECIMAL_COMMA_MODE = (('dgdc', SCRIPTS),)
+
+class Features:
+    ALL = 'all'
+    SPACE = 'space'
+    COMMA = 'comma'
+    APOSTROPHE = 'apostrophe'
+    DOT = 'dot'
+    HEXADECIMAL = 'hexadecimal'
+    DECIMAL_COMMA = 'decimal-comma'
+    ALWAYS = 'always'
+    _MAP = {
+        ALL: {'dgsp', 'dgco', 'dgap', 'dgdo', 'dghx'},
+        SPACE: {'dgsp'},
+        COMMA: {'dgco'},
+        APOSTROPHE: {'dgap'},
+        DOT: {'dgdo'},
+        HEXADECIMAL: {'dghx'},
+        DECIMAL_COMMA: {'dgdc'},
+        ALWAYS: {'calt'},
+    }
+    @classmethod
+    def get(cls, which):
+        if which is None:
+            return tuple(tuple())
+        return tuple( (fourcc, SCRIPTS) for fourcc in cls._MAP[which] )
+
+    @classmethod
+    def make_always(cls, fourcc):
+        for v in cls._MAP.values():
+            if fourcc in v:
+                v.update(cls._MAP[cls.ALWAYS])
+
+    @classmethod
+    @contextlib.contextmanager
+    def always_on(cls, fourcc):
+        # make_always(), only until the end of the with block.
+        saved = { k: set(v) for k, v in cls._MAP.items() }
+        if fourcc:
+            cls.make_always(fourcc)
+        try:
+            yield
+        finally:
+            for k, v in saved.items():
+                cls._MAP[k] = v
+
+
+# Placeholder glyphs used to classify digits while the rules run.  They're
+# copies of arbitrary letters because they're never meant to be seen.
+MARKERS = (
+    ('thsp.capture3', 'z'),
+    ('thsp.capture4', 'y'),
+    ('thsp.capture5', 'x'),
+    ('thsp.avoid', 'v'),
+)
+CAPTURES = tuple(name for name, _ in MARKERS)
+
+# Without markers, digits are classified by swapping in copies of themselves
+# instead.  (class, digits, suffix) for the copy of each digit in that class,
+# where the brk classes are the last digit before a separator.
+DIGIT_VARIANTS = (
+    ('cap3', 'dec', 'dg3'),
+    ('cap4', 'hex', 'dg4'),
+    ('cap5', 'dec', 'dg5'),
+    ('avoid', 'hex', 'dgav'),
+    ('brk3', 'dec', 'dgbrk3'),
+    ('brk4', 'hex', 'dgbrk4'),
+    ('brk5', 'dec', 'dgbrk5'),
+)
+
+# Separator glyphs for each group size, copied from the first of the
+# listed characters which the font has.
+SEPARATORS = (
+    ('sep', '\N{THIN SPACE} '),
+    ('comma', ','),
+    ('apostrophe', "'"),
+    ('dot', '.'),
+)
+GROUP_SIZES = (3, 4, 5)
+
+# Every character the rules or the patcher look up in a face's cmap: the
+# digits and the characters glyph_classes() asks for, the separators'
+# sources, the default gap size candidates and the markers' sources.
+ANALYSED_CHARS = ''.join(sorted(set(
+        HEXADECIMAL_LIST + 'bBoOxX.,#' + '\N{THIN SPACE},. '
+        + ''.join(chars for _, chars in SEPARATORS)
+        + ''.join(source for _, source in MARKERS))))
+
+
+def separator_glyphs():
+    for d in GROUP_SIZES:
+        for kind, chars in SEPARATORS:
+            yield f'thsp.{kind}{d}', chars
+
+
+def find_gap_size(gap_size, size_of_0, first_width):
+    # first_width(chars) gives the width of the first of chars that is in
+    # the font, or None.
+    with contextlib.suppress(ValueError):
+        result = int(gap_size)
+        if result > 0:
+            return result
+
+    with contextlib.suppress(ValueError):
+        if gap_size.endswith('%'):
+            scale = int(gap_size[:-1]) * 0.01
+        else:
+            scale = float(gap_size)
+        result = int(size_of_0 * scale)
+        if result > 0:
+            return result
+
+    width = first_width(gap_size if gap_size else '\N{THIN SPACE},. ')
+    if width is not None:
+        gap_size = width
+
+    # if suggested gap size is the size of a 0 it's probably
+    # a monospaced font, so use the default monospace gap.
+    if gap_size > size_of_0 // 2:
+        gap_size = size_of_0 // 4
+    return gap_size
+
+
+def separator_shift(name, gap_size, monospace):
+    # How far a separator's outline moves from its source, and how wide it
+    # ends up.  In monospace the separator takes no room of its own and
+    # sits over the gap made by pinching the neighbouring digits.
+    if monospace:
+        return (-gap_size if name.endswith('5') else gap_size), 0
+    return 0, gap_size
+
+
+@functools.lru_cache(maxsize=None)
+def adjustments(gap_size):
+    # Shared between callers, so not to be modified.
+    return {
+        'lf_1_6': -1 * (gap_size // 6),
+        'rt_1_6':  1 * (gap_size // 6),
+        'lf_1_4': -1 * (gap_size // 4),
+        'rt_1_4':  1 * (gap_size // 4),
+        'lf_1_2': -1 * (gap_size // 2),
+        'rt_1_2':  1 * (gap_size // 2),
+        'lf_3_4': -3 * (gap_size // 4),
+        'rt_1_3':  1 * (gap_size // 3),
+        'rt_2_3':  2 * (gap_size // 3),
+        'lf_1_1': -1 * (gap_size // 1),
+        'rt_1_1':  1 * (gap_size // 1),
+    }
+
+
+def shift_suffixes(gap_size, dedup=False):
+    # The suffix of the shifted copy of a digit that each adjustment uses in
+    # terminal mode.  With dedup, adjustments which come to the same offset
+    # share the first one's copy, and those which come to nothing use the
+    # digit itself (None).
+    result = {}
+    seen = {}
+    for name, offset in adjustments(gap_size).items():
+        if not dedup:
+            result[name] = name
+        elif offset:
+            result[name] = seen.setdefault(offset, name)
+        else:
+            result[name] = None
+    return result
+
+
+def glyph_classes(equivalents, terminal, marker_free=False, suffixes=None):
+    # equivalents(basis) gives the set of glyph names reachable from the
+    # characters in basis.  suffixes is from shift_suffixes().
+    dec_group = equivalents('0123456789')
+    hex_group = dec_group | equivalents('abcdefABCDEF')
+    dsep_group = equivalents('.,')
+
+    classes = {
+        'dec': dec_group,
+        'hex': hex_group,
+        'sep3': ['thsp.sep3'],
+        'sep4': ['thsp.sep4'],
+        'sep5': ['thsp.sep5'],
+        'anysep3': ['thsp.sep3','thsp.comma3','thsp.apostrophe3','thsp.dot3'],
+        'anysep4': ['thsp.sep4','thsp.comma4','thsp.apostrophe4','thsp.dot4'],
+        'anysep5': ['thsp.sep5','thsp.comma5','thsp.apostrophe5','thsp.dot5'],
+        'cap3': ['thsp.capture3'],
+        'cap4': ['thsp.capture4'],
+        'cap5': ['thsp.capture5'],
+        'avoid': ['thsp.avoid'],
+        'anycap': list(CAPTURES),
+        'zero': equivalents('0'),
+        'xx': equivalents('bBoOxX'),
+        'dot': equivalents('.'),
+        'comma': equivalents(','),
+        'hash': equivalents('#'),
+        'dotsep5': dsep_group | {'thsp.sep5','thsp.comma5','thsp.apostrophe5','thsp.dot5'},
+    }
+    if marker_free:
+        for name, digits, suffix in DIGIT_VARIANTS:
+            classes[name] = [ g+'.'+suffix for g in sorted(classes[digits]) ]
+        classes['anycap'] = class_union(classes, ('cap3','cap4','cap5','avoid'))
+        classes['capbrk3'] = classes['cap3'] + classes['brk3']
+        classes['capbrk4'] = classes['cap4'] + classes['brk4']
+    suffixes = suffixes or shift_suffixes(0)
+    for name in adjustments(0):
+        classes['hex_'+name] = classes['hex']
+        classes['dec_'+name] = classes['dec']
+        if terminal and suffixes[name]:
+            suffix = suffixes[name]
+            classes['hex_'+name] = [ v+'.'+suffix for v in classes['hex'] ]
+            classes['dec_'+name] = [ v+'.'+suffix for v in classes['dec'] ]
+    return classes
+
+
+def reachable(names, successors):
+    # names, and every glyph successors(name) leads to from them, however
+    # indirectly.
+    result = set(names)
+    todo = list(result)
+    while todo:
+        for name in successors(todo.pop()):
+            if name not in result:
+                result.add(name)
+                todo.append(name)
+    return result
+
+
+class FaceAnalysis:
+    # Everything patching asks of a face, found in one pass so nothing after
+    # has to go back to the font: how many glyphs it has, the glyph for each
+    # of the ANALYSED_CHARS it maps, what each of those can be substituted
+    # with (however indirectly), and the (width, lsb, rsb) of all of them.
+    # It's plain data, so as_dict() can be kept in the output cache or used
+    # by the other backend.
+    __slots__ = ('glyph_count', 'cmap', 'successors', 'metrics')
+
+    def __init__(self, glyph_count, cmap, successors, metrics):
+        self.glyph_count = glyph_count
+        self.cmap = cmap
+        self.successors = successors
+        self.metrics = metrics
+
+    @classmethod
+    def gather(cls, glyph_count, chars, glyph_of, successors_of, metrics_of):
+        # glyph_of(c) is the glyph name for c or None, successors_of(name)
+        # what it can be substituted with and metrics_of(name) its
+        # (width, lsb, rsb), or None if there's no such glyph.
+        cmap = {}
+        for c in chars:
+            name = glyph_of(c)
+            if name is not None:
+                cmap[c] = name
+        successors = {}
+        def index(name):
+            if name not in successors:
+                successors[name] = sorted(set(successors_of(name)))
+            return successors[name]
+        names = reachable(cmap.values(), index)
+        metrics = {}
+        for name in names | { source for _, source in MARKERS }:
+            measured = metrics_of(name)
+            if measured is not None:
+                metrics[name] = tuple(measured)
+        return cls(glyph_count, cmap,
+                   { k: v for k, v in successors.items() if v }, metrics)
+
+    def as_dict(self):
+        return { k: getattr(self, k) for k in self.__slots__ }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['glyph_count'], data['cmap'], data['successors'],
+                   { k: tuple(v) for k, v in data['metrics'].items() })
+
+    def first(self, chars):
+        # The glyph for the first of chars that the face has, or None.
+        return next(( self.cmap[c] for c in chars if c in self.cmap ), None)
+
+    def width(self, name):
+        return self.metrics[name][0]
+
+    def gap_size(self, gap_size):
+        def first_width(chars):
+            name = self.first(chars)
+            return self.width(name) if name else None
+        return find_gap_size(gap_size, self.width(self.cmap['0']), first_width)
+
+    def equivalents(self, basis, alternates):
+        # As for glyph_classes(), with or without alternate forms.
+        result = { self.cmap[c] for c in basis }
+        if alternates:
+            result = reachable(result, lambda name: self.successors.get(name,
+                                                                       ()))
+        return result
+
+
+def class_union(classes, names):
+    return set().union(*(classes[name] for name in names))
+
+
+def expand(result, glyph):
+    # '{g}' is the glyph, and '{b}' the glyph without its last suffix.
+    base = glyph.rsplit('.', 1)[0]
+    if isinstance(result, str):
+        return result.replace('{g}', glyph).replace('{b}', base)
+    return tuple(r.replace('{g}', glyph).replace('{b}', base) for r in result)
+
+
+# In a pinch_digits rule, the class of digits moved and the adjustment moving
+# them.
+_ADJUSTED_DIGITS = re.compile(r'{([a-z_0-9]+)} @<([a-z_0-9]+)>')
+
+
+@functools.lru_cache(maxsize=None)
+def compiled_plan(monospace, terminal, huddle, marker_free, suffixes,
+                  max_run=None):
+    # lookup_plan(), with suffixes as a tuple of its items, worked out once
+    # for each combination of options and then shared by every face patched
+    # with them; only the classes (the glyph names) and the gap size differ
+    # from one face to the next.
+    return tuple(lookup_plan(monospace, terminal, huddle, marker_free,
+                             dict(suffixes), max_run))
+
+
+def lookup_plan(monospace, terminal, huddle, marker_free=False,
+                suffixes=None, max_run=None):
+    # The plan is a list of operations:
+    #   ('lookup', name, lu_type, which)      a contextual lookup
+    #   ('glyph_rule', name, lu_type, which)  a lookup with one subtable of
+    #                                         per-glyph rules, of the same name
+    #   ('sub', name, classes, result)        for each glyph g in the union of
+    #                                         classes, substitute result with
+    #                                         '{g}' replaced by g
+    #   ('pos', name, classes)                for each glyph, shift it by the
+    #                                         adjustment of the same name
+    #   ('shift', name, classes)              for each glyph, make a copy
+    #                                         g.name shifted by that adjustment
+    #   ('copy', suffix, classes)             for each glyph, make a copy
+    #                                         g.suffix
+    #   ('coverage', name, rule)              add a contextual subtable to the
+    #   ('reversecoverage', name, rule)       named lookup
+    # `which` is a Features key or None, and rules use fontforge's syntax with
+    # `{class}` placeholders.
+    plan = []
+    curr_lookup = None
+
+    def new_lookup(name, lu_type, which=Features.ALL):
+        nonlocal curr_lookup
+        plan.append(('lookup', name, lu_type, which))
+        curr_lookup = name
+
+    def new_glyph_rule(name, lu_type, which=None):
+        nonlocal curr_lookup
+        plan.append(('glyph_rule', name, lu_type, which))
+        curr_lookup = name
+        return name
+
+    def add_subs(name, classes, result):
+        plan.append(('sub', name, classes, result))
+
+    def new_coverage(rule):
+        plan.append(('coverage', curr_lookup, rule))
+
+    def new_rev_coverage(rule):
+        plan.append(('reversecoverage', curr_lookup, rule))
+
+    # Each lookup is executed in the order they're listed below, but
+    # selectively enabled by their assigned font features.  Within each lookup,
+    # the first matching subtable ends the search and advances to the next
+    # character in the string.
+    #
+    # What are called 'glyph rules' here are substitutions which are described
+    # within the glyph rather than within context rules.  The lookup and
+    # subtable are given the same name so they can be used interchangeably
+    # (glyphs reference the subtable, and subtable rules reference the lookup).
+    #
+    # Broadly, each group of digits is classified by its prefix, in left-to-
+    # right order, and that classification is stretched out to the end of the
+    # group of digits.  Then rules for whole numbers are applied in right-to-
+    # left order to form groups of three or four digits depending on the
+    # capture type, and a rule for decimals is applied in left-to-right order
+    # to form groups of five digits.  Finally another rule sweeps away the
+    # classification markers.
+    #
+    # After that a couple of extra tweaks are applied to use different
+    # characters for the thousand separators if needed.
+
+    # With marker_free, rather than following each digit with a marker, the
+    # digit itself is replaced by a copy for its classification, and a digit
+    # that ends a group by a copy which finally splits into the digit and a
+    # separator.  The glyph buffer only grows by the separators, instead of
+    # doubling, and already-classified digits drop out of the digit classes
+    # so they don't need to be ignored.  The classes named after the markers
+    # hold the copies instead, so most of the rules are the same either way.
+    if marker_free:
+        for name, digits, suffix in DIGIT_VARIANTS:
+            plan.append(('copy', suffix, (digits,)))
+        new_glyph_rule('capture_3digit', 'gsub_single')
+        new_glyph_rule('capture_4digit', 'gsub_single')
+        new_glyph_rule('capture_5digit', 'gsub_single')
+        new_glyph_rule('capture_avoid', 'gsub_single')
+        add_subs('capture_3digit', ('dec',), '{g}.dg3')
+        add_subs('capture_4digit', ('hex',), '{g}.dg4')
+        add_subs('capture_5digit', ('dec',), '{g}.dg5')
+        add_subs('capture_avoid', ('hex',), '{g}.dgav')
+        # A rule to end a group of five, as the reverse chaining rules do
+        # for the others.
+        new_glyph_rule('break_5digit', 'gsub_single')
+        add_subs('break_5digit', ('cap5',), '{b}.dgbrk5')
+    else:
+        # Rules to mark any digit in a string
+        new_glyph_rule('capture_3digit', 'gsub_multiple')
+        new_glyph_rule('capture_4digit', 'gsub_multiple')
+        new_glyph_rule('capture_5digit', 'gsub_multiple')
+        new_glyph_rule('capture_avoid', 'gsub_multiple')
+        # And a rule to remove those marks
+        new_glyph_rule('release_digit', 'gsub_ligature')
+        new_glyph_rule('ignore', 'gsub_single')
+        # Arguments for gsub_multiple and gsub_ligature rules look the same,
+        # but they have opposing substitution rules.
+        add_subs('capture_3digit', ('hex',), ('{g}', 'thsp.capture3'))
+        add_subs('capture_4digit', ('hex',), ('{g}', 'thsp.capture4'))
+        add_subs('capture_5digit', ('hex',), ('{g}', 'thsp.capture5'))
+        add_subs('capture_avoid', ('hex',), ('{g}', 'thsp.avoid'))
+        for cap in CAPTURES:
+            add_subs('release_digit', ('hex',), ('{g}', cap))
+        add_subs('ignore', ('hex',), '{g}')  # is this needed?
+
+        # A rule to insert separator over capture.
+        new_glyph_rule('insert_separator', 'gsub_single')
+        add_subs('insert_separator', ('cap3',), 'thsp.sep3')
+        add_subs('insert_separator', ('cap4',), 'thsp.sep4')
+        add_subs('insert_separator', ('cap5',), 'thsp.sep5')
+
+    # With max_run, a run of more than that many digits is avoided as soon
+    # as it starts, and the avoidance carried along it, rather than grouped.
+    # That bounds how far any rule has to look, however long the run is.
+    if max_run:
+        too_long = ' '.join(['{hex}'] * max_run)
+
+    # Capture hexadecimal generously if cofigured to do so
+    new_lookup('capture_as_hex', 'gsub_contextchain', Features.HEXADECIMAL)
+    if max_run:
+        new_coverage('{avoid} | {hex} @<capture_avoid> |')
+        new_coverage(f'| {{hex}} @<capture_avoid> | {too_long}')
+    new_coverage('| {hex} @<capture_4digit> | {hex} {hex} {hex} {hex}')
+
+    new_lookup('comma_as_decimal', 'gsub_contextchain', Features.DECIMAL_COMMA)
+    if max_run:
+        new_coverage(f'{{comma}} | {{dec}} @<capture_avoid> | {too_long}')
+    # if it's `n,nnnn` that's a decimal number
+    new_coverage( '{dec} {comma} | {dec} @<capture_5digit> | {dec} {dec} {dec} {dec}')
+    new_coverage('{cap3} {comma} | {dec} @<capture_5digit> | {dec} {dec} {dec} {dec}')
+    # otherwise if it's `,nnnnn` it's not clear what it is, so avoid it.
+    new_coverage(       '{comma} | {dec} @<capture_avoid> | {dec} {dec} {dec}')
+    # and we switch off support for decimal dot, while we're here.
+    new_coverage(   '{dec} {dot} | {dec} @<capture_avoid> | {dec} {dec} {dec}')
+    new_coverage(  '{cap3} {dot} | {dec} @<capture_avoid> | {dec} {dec} {dec}')
+
+    # Captures for all the different digit types
+    new_lookup('capture_numbers', 'gsub_contextchain')
+    # first flow continue any numbers that are already in progress,
+    # but avoid doubling up on captures (can happen when using extra features)...
+    if not marker_free:
+        new_coverage('{anycap} | {hex} @<ignore> | {anycap}')
+    # and then fill everything following a capture to match that type
+    new_coverage('{cap3} | {dec} @<capture_3digit> |')
+    new_coverage('{cap4} | {hex} @<capture_4digit> |')
+    new_coverage('{cap5} | {dec} @<capture_5digit> |')
+    new_coverage('{avoid} | {hex} @<capture_avoid> |')
+
+    if max_run:
+        new_coverage(f'| {{hex}} @<capture_avoid> | {too_long}')
+
+    # Try to avoid #xxxxxx because it's probably a colour code.
+    new_coverage(      '{hash} | {dec} @<capture_3digit> | {dec} {dec} {dec} {dec} {dec} {dec}')
+    new_coverage(      '{hash} | {hex} @<capture_avoid>  | {hex} {hex} {hex} {hex} {hex}')
+
+    # if it's `..nnnnn`, that's probably an integer following a range.
+    new_coverage( '{dot} {dot} | {dec} @<capture_3digit> | {dec} {dec} {dec} {dec}')
+    # if it's `n.nnnn` that's a decimal number
+    new_coverage( '{dec} {dot} | {dec} @<capture_5digit> | {dec} {dec} {dec} {dec}')
+    new_coverage('{cap3} {dot} | {dec} @<capture_5digit> | {dec} {dec} {dec} {dec}')
+    # otherwise if it's `.nnnnn` it's not clear what it is, so avoid it.
+    new_coverage(       '{dot} | {dec} @<capture_avoid> | {dec} {dec} {dec}')
+
+    ## TODO: consider: excluding `x` in middle of number (is it `XXXxYYY`?)
+    # This is already partially-implemented in that the capture will break the
+    # `0x` match.
+    ## TODO: consider `'hxxx` for Verilog, `16#xxx` for VHDL, sh, Ada, etc..
+    new_coverage( '{zero} {xx} | {hex} @<capture_4digit> | {hex} {hex} {hex} {hex}')
+    # Only put the decimal capture at the _first_ decimal digit in a number.
+    new_coverage(             '| {dec} @<capture_3digit> | {dec} {dec} {dec} {dec}')
+
+    if marker_free:
+        # Mark every nth digit as the end of a group
+        new_lookup('reflow_numbers_rev', 'gsub_reversecchain')
+        new_rev_coverage('| {cap3} => {brk3} | {cap3} {cap3} {capbrk3}')
+        new_rev_coverage('| {cap4} => {brk4} | {cap4} {cap4} {cap4} {capbrk4}')
+        new_lookup('reflow_numbers_fwd', 'gsub_contextchain')
+        new_coverage('{cap5} {cap5} {cap5} {cap5} | {cap5} @<break_5digit> | {cap5}')
+
+        # Put the original digits back, with separators after group ends
+        new_glyph_rule('release_digit', 'gsub_single', Features.ALL)
+        add_subs('release_digit', ('anycap',), '{b}')
+        new_glyph_rule('split_digit', 'gsub_multiple', Features.ALL)
+        for d in [3,4,5]:
+            add_subs('split_digit', (f'brk{d}',), ('{b}', f'thsp.sep{d}'))
+    else:
+        # Convert every nth capture into a digit group
+        new_lookup('reflow_numbers_rev', 'gsub_reversecchain')
+        new_rev_coverage('| {cap3} => {sep3} | {dec} {cap3} {dec} {cap3} {dec}')
+        new_rev_coverage('| {cap4} => {sep4} | {hex} {cap4} {hex} {cap4} {hex} {cap4} {hex}')
+        new_lookup('reflow_numbers_fwd', 'gsub_contextchain')
+        new_coverage('{dec} {cap5} {dec} {cap5} {dec} {cap5} {dec} {cap5} {dec}'
+                     ' | {cap5} @<insert_separator> | {dec}')
+
+        # Remove unused capture markers
+        new_lookup('release_numbers', 'gsub_contextchain')
+        new_coverage('| {hex} @<release_digit> {anycap} |')
+
+    # convert separators into commas or apostrophes (TBD, dots?)
+    new_glyph_rule('comma_separator', 'gsub_single', Features.COMMA)
+    new_glyph_rule('apostrophe_separator', 'gsub_single', Features.APOSTROPHE)
+    new_glyph_rule('dot_separator', 'gsub_single', Features.DOT)
+    for d in [3,4,5]:
+        add_subs('comma_separator', (f'sep{d}',), f'thsp.comma{d}')
+        add_subs('apostrophe_separator', (f'sep{d}',), f'thsp.apostrophe{d}')
+        add_subs('dot_separator', (f'sep{d}',), f'thsp.dot{d}')
+
+    if monospace:
+        # I believe it's legal to fold all the lookups onto one line, but
+        # fontforge doesn't seem to support it, so this is unrolled.  It might
+        # be that the multi-lookup form of the table was always split into
+        # separate entries anyway.  I do not know.
+
+        # TODO: Another mode, like huddle, but where where digits are repelled
+        # by the thousand separator.  This also minimises move distance but
+        # will make groups have irregular spacing.  But the thousand separator
+        # gap is always full-sized.
+        if huddle:
+            rules = [
+                '{dotsep5} | {dec} @<rt_1_2> | {dec} {dec} {dec} {dec} {anysep5}',
+                '{dotsep5} {dec_rt_1_2} | {dec} @<rt_1_4> | {dec} {dec} {dec} {anysep5}',
+                # middle digit doesn't move
+                '{dotsep5} {dec_rt_1_2} {dec_rt_1_4} {dec} | {dec} @<lf_1_4> | {dec} {anysep5}',
+                '{dotsep5} {dec_rt_1_2} {dec_rt_1_4} {dec} {dec_lf_1_4} | {dec} @<lf_1_2> | {anysep5}',
+                '{anysep4} | {hex} @<rt_1_2> | {hex} {hex} {hex}',
+                '{anysep4} {hex_rt_1_2} | {hex} @<rt_1_6> | {hex} {hex}',
+                '{anysep4} {hex_rt_1_2} {hex_rt_1_6} | {hex} @<lf_1_6> | {hex}',
+                '{anysep4} {hex_rt_1_2} {hex_rt_1_6} {hex_lf_1_6} | {hex} @<lf_1_2> |',
+                '{anysep3} | {dec} @<rt_1_2> | {dec} {dec}',
+                # middle digit doesn't move
+                '{anysep3} {dec_rt_1_2} {dec} | {dec} @<lf_1_2> |',
+            ]
+        else:
+            rules = [
+                # first digit doesn't move
+                '{dotsep5} {dec} | {dec} @<lf_1_4> | {dec} {dec} {dec} {anysep5}',
+                '{dotsep5} {dec} {dec_lf_1_4} | {dec} @<lf_1_2> | {dec} {dec} {anysep5}',
+                '{dotsep5} {dec} {dec_lf_1_4} {dec_lf_1_2} | {dec} @<lf_3_4> | {dec} {anysep5}',
+                '{dotsep5} {dec} {dec_lf_1_4} {dec_lf_1_2} {dec_lf_3_4} | {dec} @<lf_1_1> | {anysep5}',
+                '{anysep4} | {hex} @<rt_1_1> | {hex} {hex} {hex}',
+                '{anysep4} {hex_rt_1_1} | {hex} @<rt_2_3> | {hex} {hex}',
+                '{anysep4} {hex_rt_1_1} {hex_rt_2_3} | {hex} @<rt_1_3> | {hex}',
+                # last digit doesn't move
+                '{anysep3} | {dec} @<rt_1_1> | {dec} {dec}',
+                '{anysep3} {dec_rt_1_1} | {dec} @<rt_1_2> | {dec}',
+                # last digit doesn't move
+            ]
+
+        useful_adjustments = {}
+        for r in rules:
+            match = _ADJUSTED_DIGITS.search(r)
+            name, digits = match.group(2, 1)
+            useful_adjustments.setdefault(name, [])
+            if digits not in useful_adjustments[name]:
+                useful_adjustments[name].append(digits)
+
+        if terminal:
+            suffixes = suffixes or shift_suffixes(0)
+            shifts = {}
+            for name, digits in useful_adjustments.items():
+                if suffixes[name]:
+                    shared = shifts.setdefault(suffixes[name], [])
+                    shared.extend( d for d in digits if d not in shared )
+            for suffix, digits in shifts.items():
+                plan.append(('shift', suffix, tuple(digits)))
+            for name, digits in useful_adjustments.items():
+                new_glyph_rule(name, 'gsub_single')
+                suffix = suffixes[name]
+                add_subs(name, tuple(digits), '{g}.' + suffix if suffix else '{g}')
+
+            new_lookup('pinch_digits', 'gsub_contextchain')
+        else:
+            # switch to gpos
+            for name, digits in useful_adjustments.items():
+                new_glyph_rule(name, 'gpos_single')
+                plan.append(('pos', name, tuple(digits)))
+
+            new_lookup('pinch_digits', 'gpos_contextchain')
+
+        for r in rules:
+            new_coverage(r)
+
+    return plan
+
+
+# The options that make up each of the ways a font can be patched.
+MODES = {
+    'default': { 'monospace': False, 'terminal': False, 'huddle': False },
+    'monospace': { 'monospace': True, 'terminal': False, 'huddle': False },
+    'terminal': { 'monospace': True, 'terminal': True, 'huddle': False },
+    'huddle': { 'monospace': True, 'terminal': False, 'huddle': True },
+}
+
+# A font can't address more glyphs than this.
+GLYPH_LIMIT = 65535
+
+
+def new_glyph_counts(plan, classes, marker_free):
+    counts = {
+        'markers': 0 if marker_free else len(MARKERS),
+        'separators': len(list(separator_glyphs())),
+        'digit copies': 0,
+        'shifted digits': 0,
+    }
+    for kind, name, *args in plan:
+        if kind == 'copy':
+            counts['digit copies'] += len(class_union(classes, args[0]))
+        elif kind == 'shift':
+            counts['shifted digits'] += len(class_union(classes, args[0]))
+    return counts
+
+
+def plan_counts(plan):
+    return {
+        'lookups': sum( kind in ('lookup', 'glyph_rule')
+                        for kind, *_ in plan ),
+        'subtables': sum( kind in ('glyph_rule', 'coverage',
+                                   'reversecoverage', 'class')
+                          for kind, *_ in plan ),
+    }
+
+
+def plan_phase(kind, name):
+    # Which part of patching an operation belongs to, for reports.
+    if kind in ('copy', 'shift'):
+        return 'glyphs'
+    if name == 'pinch_digits' or name in adjustments(0):
+        return 'pinch_digits'
+    return 'lookups'
+
+
+class OverBudget(ValueError):
+    # A face which can't be patched within the glyph budget.
+    pass
+
+
+def glyph_plan(equivalents, monospace, terminal, huddle, marker_free,
+               gap_size, dedup_shifts=False, existing=0, budget=None,
+               max_run=None):
+    # The classes, plan and new glyph counts for patching a font which has
+    # `existing` glyphs already, and what had to be given up to get there.
+    # equivalents(basis, alternates) is as for glyph_classes(), with or
+    # without any alternate forms of the digits.  If the result would have
+    # more than `budget` glyphs, shifted digits are deduplicated and then the
+    # alternates are left out, before giving up with OverBudget.
+    attempts = [ (dedup_shifts, True), (True, True), (True, False) ]
+    for dedup, alternates in sorted(set(attempts), key=attempts.index):
+        suffixes = shift_suffixes(gap_size, dedup)
+        classes = glyph_classes(lambda basis: equivalents(basis, alternates),
+                                terminal, marker_free, suffixes)
+        plan = compiled_plan(monospace, terminal, huddle, marker_free,
+                             tuple(suffixes.items()), max_run)
+        counts = new_glyph_counts(plan, classes, marker_free)
+        total = existing + sum(counts.values())
+        if budget is None or total <= budget:
+            over_budget = []
+            if dedup != dedup_shifts and terminal:
+                over_budget.append('sharing equal shifts')
+            if not alternates:
+                over_budget.append('leaving out alternate digits')
+            return classes, plan, counts, over_budget
+    raise OverBudget(f'{total} glyphs would be over the budget of {budget}')
+
+
+def parse_rule(rule):
+    # Split a coverage rule into its backtrack, match and lookahead class
+    # names, with each match position paired with its lookup (or None).
+    backtrack, match, lookahead = ( part.split() for part in rule.split('|') )
+    positions = []
+    for token in match:
+        if token.startswith('@<'):
+            positions[-1] = (positions[-1][0], token[2:-1])
+        else:
+            positions.append((token[1:-1], None))
+    return ([ t[1:-1] for t in backtrack ], positions,
+            [ t[1:-1] for t in lookahead ])
+
+
+def _atoms(names, classes):
+    # Partition the glyphs of some overlapping classes into disjoint sets,
+    # keyed by the classes they belong to.
+    membership = {}
+    for name in sorted(set(names)):
+        for g in classes[name]:
+            membership.setdefault(g, set()).add(name)
+    atoms = {}
+    for g, owners in membership.items():
+        atoms.setdefault(frozenset(owners), []).append(g)
+    return sorted( (sorted(owners), sorted(glyphs))
+                   for owners, glyphs in atoms.items() )
+
+
+def _class_subtable(rules, classes):
+    # Rewrite a run of coverage rules as one class-based subtable, with each
+    # overlapping class split into the disjoint classes it covers.  Returns
+    # the class definitions for each role and the rewritten rules.
+    roles = ( [ c for r in rules for c in r[0] ],
+              [ c for r in rules for c, _ in r[1] ],
+              [ c for r in rules for c in r[2] ] )
+    class_defs = tuple( _atoms(names, classes) for names in roles )
+
+    def choices(role, name):
+        return [ f'{{{"bmf"[role]}{i+1}}}'
+                 for i, (owners, _) in enumerate(class_defs[role])
+                 if name in owners ]
+
+    class_rules = []
+    for backtrack, match, lookahead in rules:
+        positions = ( [ choices(0, c) for c in backtrack ]
+                    + [ choices(1, c) for c, _ in match ]
+                    + [ choices(2, c) for c in lookahead ] )
+        for combination in itertools.product(*positions):
+            combination = list(combination)
+            b = combination[:len(backtrack)]
+            m = combination[len(backtrack):len(backtrack) + len(match)]
+            f = combination[len(backtrack) + len(match):]
+            m = [ f'{c} @<{lookup}>' if lookup else c
+                  for c, (_, lookup) in zip(m, match) ]
+            class_rules.append(' '.join(b + ['|'] + m + ['|'] + f))
+    return (tuple( [ glyphs for _, glyphs in defs ] for defs in class_defs ),
+            class_rules)
+
+
+# Rough cost of probing one more subtable for every glyph, in bytes.
+SUBTABLE_COST = 32
+
+
+def _run_size(groups, classes):
+    # Estimated size of a run of subtables, each either a single coverage
+    # rule (format 3) or a merged class-based one (format 2).  Identical
+    # coverage and class tables are shared when compiled, so count them once.
+    coverages = set()
+    class_tables = set()
+    size = SUBTABLE_COST * len(groups)
+    for rules in groups:
+        if len(rules) == 1:
+            backtrack, match, lookahead = rules[0]
+            names = backtrack + [ c for c, _ in match ] + lookahead
+            size += 10 + 2 * len(names) + 4 * sum(1 for _, l in match if l)
+            coverages.update( frozenset(classes[c]) for c in names )
+            continue
+        class_defs, class_rules = _class_subtable(rules, classes)
+        coverages.add(frozenset( g for glyphs in class_defs[1]
+                                 for g in glyphs ))
+        class_tables.update( tuple(map(tuple, defs)) for defs in class_defs
+                             if defs )
+        size += 16 + 2 * len(class_defs[1])
+        for rule in class_rules:
+            size += 12 + 2 * (rule.count('{') - 1) + 4 * rule.count('@<')
+    size += sum( 4 + 2 * len(glyphs) for glyphs in coverages )
+    size += sum( 6 + 2 * sum(map(len, defs)) for defs in class_tables )
+    return size
+
+
+def single_class_context(plan, classes, name):
+    # Replace all of a lookup's coverage rules with one class-based subtable,
+    # whatever its size, so each glyph is only probed against it once.
+    rules = [ parse_rule(op[2]) for op in plan
+              if op[0] == 'coverage' and op[1] == name ]
+    merged = [ ('class', name) + _class_subtable(rules, classes) ]
+    result = []
+    for op in plan:
+        if op[0] == 'coverage' and op[1] == name:
+            result.extend(merged)
+            merged = []
+        else:
+            result.append(op)
+    return result
+
+
+def class_contexts(plan, classes):
+    # Replace runs of coverage subtables in the same lookup with class-based
+    # subtables where that comes out smaller, counting each subtable's probe
+    # cost.  Only consecutive rules are merged, so the first-match-wins
+    # behaviour is the same either way: a glyph's rules within a class
+    # subtable are tried in their original order.
+    def merge(run):
+        name = run[0][1]
+        rules = [ rule for _, _, rule in run ]
+        parsed = [ parse_rule(rule) for rule in rules ]
+        splits = [0]
+        while splits[-1] < len(rules):
+            # the longest worthwhile group from here, with the rest unmerged
+            def size(end):
+                return _run_size([ parsed[a:b] for a, b
+                                   in zip(splits, splits[1:] + [end]) ]
+                                 + [ [p] for p in parsed[end:] ], classes)
+            start = splits[-1]
+            splits.append(min(range(len(rules), start, -1), key=size))
+        for a, b in zip(splits, splits[1:]):
+            if b - a == 1:
+                yield ('coverage', name, rules[a])
+            else:
+                yield ('class', name) + _class_subtable(parsed[a:b], classes)
+
+    result = []
+    run = []
+    for op in plan:
+        if run and (op[0] != 'coverage' or op[1] != run[-1][1]):
+            result.extend(merge(run))
+            run = []
+        if op[0] == 'coverage':
+            run.append(op)
+        else:
+            result.append(op)
+    if run:
+        result.extend(merge(run))
+    return result
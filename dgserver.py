@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# Keep fontforge and everything else imported in one long-running process,
+# and patch fonts for digitgrouper.py command lines sent to it as JSON lines,
+# either on stdin or over a Unix socket (see dgclient.py).
+#
+# A request is { "id": ..., "args": [ ... ], "cwd": "..." }, and each gets
+# back { "id": ..., "status": "ok" or "error", "exit": ..., "output": ...,
+# "error": ..., "seconds": ... } when it finishes, which may not be in the
+# order they were sent.
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import multiprocessing
+import os
+import signal
+import socketserver
+import sys
+import threading
+import time
+import traceback
+
+import dgclient
+import digitgrouper
+
+# digitgrouper.py only imports fontforge when it opens a font, so import it
+# here, once, for every worker to inherit.
+with contextlib.suppress(ImportError):
+    importlib.import_module('fontforge')
+
+PARSER = digitgrouper.argument_parser()
+PARSER.prog = 'digitgrouper.py'
+
+
+def quiet_worker():
+    # Anything printed below Python, by fontforge say, goes to stderr rather
+    # than into the responses on stdout, and ^C is for the server to handle.
+    os.dup2(2, 1)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def run_job(job):
+    # Each job gets a freshly forked worker, so options like --always-on
+    # and the working directory don't leak from one job into the next.
+    start = time.perf_counter()
+    out = io.StringIO()
+    err = io.StringIO()
+    code = 0
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+        try:
+            os.chdir(job.get('cwd') or '.')
+            args = PARSER.parse_args(job['args'])
+            # workers can't start pools of their own
+            args.jobs = 1
+            digitgrouper.main(**vars(args))
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else 1
+        except Exception:
+            traceback.print_exc()
+            code = 1
+    return {
+        'id': job.get('id'),
+        'status': 'ok' if code == 0 else 'error',
+        'exit': code,
+        'output': out.getvalue(),
+        'error': err.getvalue(),
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def bad_request(line, e):
+    return { 'id': None, 'status': 'error', 'exit': 2, 'output': '',
+             'error': f'bad request: {e}: {line!r}\n', 'seconds': 0.0 }
+
+
+def serve_lines(pool, lines, send):
+    # Start every job read from lines, send() each result as it finishes, and
+    # return once they all have.
+    lock = threading.Lock()
+    def finished(result):
+        print(f'{result["id"]}: {result["status"]} '
+              f'({result["seconds"]:.2f}s)', file=sys.stderr)
+        with lock:
+            send(result)
+    pending = []
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            job = json.loads(line)
+            job['args'] = [ str(a) for a in job['args'] ]
+        except (ValueError, TypeError, KeyError) as e:
+            finished(bad_request(line, e))
+            continue
+        pending.append(pool.apply_async(run_job, (job,), callback=finished))
+    for result in pending:
+        result.wait()
+
+
+def main(socket_path, jobs):
+    with multiprocessing.Pool(jobs or None, quiet_worker,
+                              maxtasksperchild=1) as pool:
+        if not socket_path:
+            def send(result):
+                sys.stdout.write(json.dumps(result) + '\n')
+                sys.stdout.flush()
+            serve_lines(pool, sys.stdin, send)
+            return
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                def send(result):
+                    self.wfile.write(json.dumps(result).encode() + b'\n')
+                serve_lines(pool, self.rfile, send)
+
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(socket_path)
+        with socketserver.ThreadingUnixStreamServer(socket_path,
+                                                    Handler) as server:
+            print('listening: ', socket_path, file=sys.stderr)
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                os.unlink(socket_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+            description='Serve digitgrouper.py jobs from a warm process.')
+    parser.add_argument('--socket', metavar='path', dest='socket_path',
+            help='Listen on this Unix socket (default: read jobs from stdin).',
+            nargs='?', default=None, const=dgclient.SOCKET)
+    parser.add_argument('-j', '--jobs', metavar='N',
+            help='Run up to N jobs at once (0: one per CPU).',
+            type=int, default=0)
+    main(**vars(parser.parse_args()))
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# Compare the layout tables of patched fonts, eg. the same font built with
+# and without --class-contexts.
+import argparse
+import collections
+
+from fontTools.ttLib import TTFont
+
+
+def layout_stats(path):
+    font = TTFont(path, lazy=True)
+    stats = collections.OrderedDict()
+    for tag in ('GSUB', 'GPOS', 'GDEF'):
+        if tag in font:
+            stats[tag + ' bytes'] = len(font.reader[tag])
+    for tag in ('GSUB', 'GPOS'):
+        if tag not in font:
+            continue
+        lookups = font[tag].table.LookupList.Lookup
+        formats = collections.Counter()
+        for lookup in lookups:
+            for subtable in lookup.SubTable:
+                # look through extension subtables
+                subtable = getattr(subtable, 'ExtSubTable', subtable)
+                # fontTools folds some formats away when decompiling
+                fmt = getattr(subtable, 'Format', None)
+                formats[f'{subtable.LookupType}'
+                        + (f'.{fmt}' if fmt else '')] += 1
+        stats[tag + ' lookups'] = len(lookups)
+        stats[tag + ' subtables'] = sum(formats.values())
+        for fmt, count in sorted(formats.items()):
+            stats[f'{tag} type {fmt}'] = count
+    font.close()
+    return stats
+
+
+def main(fonts):
+    all_stats = [ layout_stats(f) for f in fonts ]
+    keys = list(collections.OrderedDict.fromkeys(
+            k for stats in all_stats for k in stats))
+    width = max(map(len, keys))
+    print(' ' * width, *( f'{f:>16.16}' for f in fonts ))
+    base = all_stats[0]
+    for key in keys:
+        row = []
+        for stats in all_stats:
+            value = stats.get(key, 0)
+            cell = str(value)
+            if stats is not base and value != base.get(key, 0):
+                cell += f' ({value - base.get(key, 0):+d})'
+            row.append(f'{cell:>16}')
+        print(f'{key:<{width}}', *row)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+            description='Layout table sizes of patched fonts, with the '
+                        'difference from the first font.')
+    parser.add_argument('fonts', metavar='font', nargs='+')
+    args = parser.parse_args()
+    main(args.fonts)
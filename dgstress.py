@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# Shape pathological inputs through patched fonts at growing lengths, to find
+# where the rules cost more per character as a run gets longer, and where
+# HarfBuzz gives up on a buffer altogether (it has a budget of operations per
+# glyph, and drops all shaping for a buffer which goes over it).
+import argparse
+import contextlib
+import sys
+import tempfile
+import time
+
+import uharfbuzz as hb
+
+import dgbench
+
+HEX = '0123456789abcdefABCDEF'
+
+
+def repeated(unit, prefix=''):
+    def make(n):
+        body = unit * ((n - len(prefix)) // len(unit) + 1)
+        return (prefix + body)[:n]
+    return make
+
+
+CASES = {
+    'digits': repeated('1234567890'),
+    'dot-digit': repeated('.1'),
+    'comma-digit': repeated('1,'),
+    'hash-hex': repeated(HEX, '#'),
+    '0x-hex': repeated(HEX, '0x'),
+    '0x0x': repeated('0x'),
+    'decimal': repeated('1234567890', '1.'),
+    'decimal-comma': repeated('1234567890', '1,'),
+    'range': repeated('12345..'),
+    'hex-letters': repeated('abcdefABCDEF'),
+    'short-runs': repeated('1234 '),
+}
+
+
+def shape_once(font, text, features):
+    # Seconds to shape text, and glyphs out, or None if HarfBuzz gave up.
+    buf = hb.Buffer()
+    buf.add_str(text)
+    buf.guess_segment_properties()
+    start = time.process_time()
+    try:
+        hb.shape(font, buf, features)
+    except MemoryError:
+        return None
+    return time.process_time() - start, len(buf)
+
+
+def stress(fonts, feature_sets, cases, lengths, repeat):
+    # {mode/features/case: {length: result}}, with each result the best
+    # ns_per_char and the growth, or failed.
+    results = {}
+    for mode, path in fonts:
+        font = dgbench.load_font(path)
+        for feature_set in feature_sets:
+            features = { f: True for f in feature_set.split(',') if f }
+            for case in cases:
+                row = results[f'{mode}/{feature_set or "-"}/{case}'] = {}
+                for n in lengths:
+                    text = CASES[case](n)
+                    runs = [ shape_once(font, text, features)
+                             for _ in range(repeat) ]
+                    if None in runs:
+                        row[n] = { 'failed': True }
+                        continue
+                    elapsed, glyphs = min(runs)
+                    row[n] = { 'ns_per_char': elapsed * 1e9 / n,
+                               'growth': glyphs / n }
+    return results
+
+
+def scaling(row):
+    # How much the cost per character grows from the shortest input to the
+    # longest, which stays around 1 for rules which are linear.
+    ok = [ r['ns_per_char'] for r in row.values() if not r.get('failed') ]
+    return ok[-1] / ok[0] if len(ok) > 1 else None
+
+
+def print_results(results, lengths):
+    print(f'{"mode/features/case":<36}',
+          *( f'{n:>10}' for n in lengths ), f'{"growth":>7} {"scaling":>8}')
+    for key, row in results.items():
+        cells = [ '    FAILED' if r.get('failed') else f'{r["ns_per_char"]:10.1f}'
+                  for r in row.values() ]
+        growth = max(( r['growth'] for r in row.values()
+                       if not r.get('failed') ), default=0)
+        factor = scaling(row)
+        print(f'{key:<36}', *cells, f'{growth:7.3f}',
+              f'{factor:8.2f}' if factor else ' ' * 8)
+
+
+def worst_cases(results, count):
+    # The slowest cases per character at the longest length which shaped.
+    costs = []
+    for key, row in results.items():
+        ok = [ (n, r) for n, r in row.items() if not r.get('failed') ]
+        if ok:
+            n, r = ok[-1]
+            costs.append((r['ns_per_char'], key, n))
+    return sorted(costs, reverse=True)[:count]
+
+
+def main(fonts, build, modes, backend, features, cases, lengths, repeat,
+         worst, max_scaling, **kwargs):
+    with contextlib.ExitStack() as stack:
+        if build:
+            tmpdir = stack.enter_context(tempfile.TemporaryDirectory())
+            fonts = dgbench.build_fonts(build, modes, backend, tmpdir,
+                                        **kwargs)
+        else:
+            fonts = [ tuple(f.split('=', 1)) if '=' in f else (f, f)
+                      for f in fonts ]
+        results = stress(fonts, features, cases, lengths, repeat)
+    print_results(results, lengths)
+
+    print()
+    print('worst cases:')
+    for cost, key, n in worst_cases(results, worst):
+        print(f'  {key} at {n} chars: {cost:.1f} ns/char')
+
+    failures = []
+    for key, row in results.items():
+        for n, r in row.items():
+            if r.get('failed'):
+                failures.append(f'{key}: HarfBuzz gave up at {n} chars')
+        factor = scaling(row)
+        if factor and factor > max_scaling:
+            failures.append(f'{key}: cost per char grew {factor:.2f}x')
+    for failure in failures:
+        print('FAILED: ', failure)
+    if failures:
+        sys.exit(f'{len(failures)} failures')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+            description='Shape pathological inputs through patched fonts.')
+    parser.add_argument('fonts', metavar='[mode=]font', nargs='*',
+            help='Patched fonts to shape with, labelled by mode.')
+    parser.add_argument('--build', metavar='font',
+            help='Patch this font in each mode, and use those.')
+    parser.add_argument('--modes', metavar='mode,...',
+            help=f'Modes to build ({",".join(dgbench.MODES)}).',
+            type=lambda s: s.split(','), default=list(dgbench.MODES))
+    parser.add_argument('--backend',
+            help='Backend to build with.',
+            choices=('fontforge', 'fonttools'), default='fonttools')
+    parser.add_argument('--marker-free',
+            help='Build with --marker-free.',
+            default=False, action='store_true')
+    parser.add_argument('--max-run', metavar='N',
+            help='Build with --max-run N.',
+            type=int, default=None)
+    parser.add_argument('--features', metavar='f,f',
+            help='Feature set to shape with (repeatable; "" for none).',
+            action='append', default=None)
+    parser.add_argument('--cases', metavar='name,...',
+            help=f'Inputs to shape ({",".join(CASES)}).',
+            type=lambda s: s.split(','), default=list(CASES))
+    parser.add_argument('--lengths', metavar='n,...',
+            help='Lengths of each input, shortest first.',
+            type=lambda s: [ int(n) for n in s.split(',') ],
+            default=[ 1000, 10000, 100000, 1000000 ])
+    parser.add_argument('--repeat', metavar='N',
+            help='Take the best of N runs.',
+            type=int, default=1)
+    parser.add_argument('--worst', metavar='N',
+            help='List the N slowest cases.',
+            type=int, default=5)
+    parser.add_argument('--max-scaling', metavar='factor',
+            help='Fail if the cost per char at the longest length is more '
+                 'than this times that at the shortest.',
+            type=float, default=2.0)
+    args = parser.parse_args()
+    if not args.fonts and not args.build:
+        parser.error('give some fonts, or --build')
+    if args.features is None:
+        args.features = [ 'dgsp', 'dghx,dgsp', 'dgdc,dgsp' ]
+    main(**vars(args))
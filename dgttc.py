@@ -0,0 +1,100 @@
+# Assemble a font collection from separate sfnt files without loading them,
+# so that however many faces there are, only one table is held in memory at
+# a time.  Tables which are byte-for-byte the same in several faces are
+# stored once and shared, which is what makes a collection of faces with
+# common outlines smaller than the faces on their own.
+import hashlib
+import shutil
+import struct
+
+TTC_HEADER = struct.Struct('>4sLL')
+SFNT_HEADER = struct.Struct('>4sHHHH')
+TABLE_ENTRY = struct.Struct('>4sLLL')
+
+
+def table_directory(f):
+    # The sfnt version and (tag, checksum, offset, length) for each table.
+    version, count, *_ = SFNT_HEADER.unpack(f.read(SFNT_HEADER.size))
+    if version == b'ttcf':
+        raise ValueError('already a collection')
+    entries = [ TABLE_ENTRY.unpack(f.read(TABLE_ENTRY.size))
+                for _ in range(count) ]
+    return version, sorted(entries)
+
+
+def table_digest(f, offset, length):
+    digest = hashlib.sha256()
+    f.seek(offset)
+    while length:
+        block = f.read(min(length, 1 << 20))
+        if not block:
+            raise ValueError('table runs past the end of the file')
+        digest.update(block)
+        length -= len(block)
+    return digest.digest()
+
+
+def padded(length):
+    return (length + 3) & ~3
+
+
+def write_ttc(filenames, output):
+    # First read the table directories and fingerprint the tables, to lay
+    # out the collection; then copy each distinct table in across.
+    faces = []
+    shared = {}
+    for filename in filenames:
+        with open(filename, 'rb') as f:
+            version, entries = table_directory(f)
+            tables = []
+            for tag, checksum, offset, length in entries:
+                key = (tag, checksum, length, table_digest(f, offset, length))
+                shared.setdefault(key, (filename, offset, length))
+                tables.append((tag, checksum, key))
+        faces.append((version, tables))
+
+    directory_size = sum( SFNT_HEADER.size + TABLE_ENTRY.size * len(tables)
+                          for _, tables in faces )
+    position = TTC_HEADER.size + 4 * len(faces) + directory_size
+    placed = {}
+    for key, (_, _, length) in shared.items():
+        placed[key] = position
+        position += padded(length)
+
+    with open(output, 'wb') as out:
+        out.write(TTC_HEADER.pack(b'ttcf', 0x00010000, len(faces)))
+        position = TTC_HEADER.size + 4 * len(faces)
+        for _, tables in faces:
+            out.write(struct.pack('>L', position))
+            position += SFNT_HEADER.size + TABLE_ENTRY.size * len(tables)
+        for version, tables in faces:
+            count = len(tables)
+            entry_selector = count.bit_length() - 1
+            search_range = 16 << entry_selector
+            out.write(SFNT_HEADER.pack(version, count, search_range,
+                                       entry_selector,
+                                       count * 16 - search_range))
+            for tag, checksum, key in tables:
+                out.write(TABLE_ENTRY.pack(tag, checksum, placed[key],
+                                           key[2]))
+        for key, (filename, offset, length) in shared.items():
+            with open(filename, 'rb') as f:
+                f.seek(offset)
+                shutil.copyfileobj(_limited(f, length), out)
+            out.write(b'\0' * (padded(length) - length))
+    print('saved: ', output)
+    return len(shared), sum( len(tables) for _, tables in faces )
+
+
+class _limited:
+    # Just enough of a file object for copyfileobj() to read length bytes.
+    def __init__(self, f, length):
+        self.f = f
+        self.left = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.left:
+            size = self.left
+        block = self.f.read(size)
+        self.left -= len(block)
+        return block
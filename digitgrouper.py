@@ -1,138 +1,69 @@
 #!/usr/bin/env python3
 import argparse
 import contextlib
-import re
-
-import fontforge
-import psMat
-
-DECIMAL_LIST = '0123456789'
-HEXADECIMAL_LIST = '0123456789abcdefABCDEF'
-
-SCRIPTS = (
-    ('DFLT',('dflt')),
-    ('latn',('dflt')),
-    ('cyrl',('dflt')),
-    ('grek',('dflt')),
-    ('kana',('dflt'))
-)
-MAIN_FEATURE = ('dgsp', SCRIPTS)
-COMMA_FEATURE = ('dgco', SCRIPTS)
-APSTR_FEATURE = ('dgap', SCRIPTS)
-DOT_FEATURE = ('dgdo', SCRIPTS)
-ALWAYS_ON_FEATURE = ('calt', SCRIPTS)
-ALL_MODES = (MAIN_FEATURE, COMMA_FEATURE, APSTR_FEATURE, DOT_FEATURE)
-HEXADECIMAL_MODE = (('dghx', SCRIPTS),)
-DECIMAL_COMMA_MODE = (('dgdc', SCRIPTS),)
-
-class Features:
-    ALL = 'all'
-    SPACE = 'space'
-    COMMA = 'comma'
-    APOSTROPHE = 'apostrophe'
-    DOT = 'dot'
-    HEXADECIMAL = 'hexadecimal'
-    DECIMAL_COMMA = 'decimal-comma'
-    ALWAYS = 'always'
-    _MAP = {
-        ALL: {'dgsp', 'dgco', 'dgap', 'dgdo', 'dghx'},
-        SPACE: {'dgsp'},
-        COMMA: {'dgco'},
-        APOSTROPHE: {'dgap'},
-        DOT: {'dgdo'},
-        HEXADECIMAL: {'dghx'},
-        DECIMAL_COMMA: {'dgdc'},
-        ALWAYS: {'calt'},
-    }
-    @classmethod
-    def get(cls, which):
-        if which is None:
-            return tuple(tuple())
-        return tuple( (fourcc, SCRIPTS) for fourcc in cls._MAP[which] )
-
-    @classmethod
-    def make_always(cls, fourcc):
-        for v in cls._MAP.values():
-            if fourcc in v:
-                v.update(cls._MAP[cls.ALWAYS])
-
-def collect_equivalents(font, basis='0123456789', use_gsubs=False):
-    result = set()
-    for c in basis:
-        glyph = font[ord(c)]
-        name = glyph.glyphname
-        result.add(name)
-        if use_gsubs:
-            additions = set()
-            for sub in glyph.getPosSub('*'):
-                if sub[1] in { 'Substitution', 'AltSubs', 'MultSubs' }:
-                    additions |= set(sub[2:])
-            # TODO: should recurse, maybe...
-            result |= additions
-    return result
-
-
-def find_first(font, chars):
-    for c in chars:
-        if ord(c) in font:
-            return font[ord(c)]
-    return None
-
-
-def find_gap_size(font, gap_size):
-    size_of_0 = font[ord('0')].width
-
-    with contextlib.suppress(ValueError):
-        result = int(gap_size)
-        if result > 0:
-            return result
-
-    with contextlib.suppress(ValueError):
-        if gap_size.endswith('%'):
-            scale = int(gap_size[:-1]) * 0.01
-        else:
-            scale = float(gap_size)
-        result = int(size_of_0 * scale)
-        if result > 0:
-            return result
-
-    glyph = find_first(font, gap_size if gap_size else '\N{THIN SPACE},. ')
-    if glyph:
-        gap_size = glyph.width
-
-    # if suggested gap size is the size of a 0 it's probably
-    # a monospaced font, so use the default monospace gap.
-    if gap_size > size_of_0 // 2:
-        gap_size = size_of_0 // 4
-    return gap_size
-
-
-def new_glyph(font, name, source=None, hshift=None):
+import itertools
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+import dgcache
+import dgmanifest
+import dgreport
+import dgrules
+import dgttc
+from dgrules import Features
+
+# fontforge and psMat are only imported once a font is opened with them, so
+# that --help, checking the options, the fonttools backend and anything else
+# importing this module don't need fontforge installed or wait for it.
+
+__version__ = '0.2'
+
+def analyse_face(font, gap_size):
+    # One pass over the cmap, substitutions and metrics of everything the
+    # patcher needs, since each call into fontforge is slow.  Any characters
+    # gap_size names are looked up too.
+    font.encoding = 'ISO10646'
+    def glyph_of(c):
+        return font[ord(c)].glyphname if ord(c) in font else None
+    def successors_of(name):
+        for sub in font[name].getPosSub('*'):
+            if sub[1] in { 'Substitution', 'AltSubs', 'MultSubs' }:
+                yield from sub[2:]
+    def metrics_of(name):
+        if name not in font:
+            return None
+        glyph = font[name]
+        return (int(glyph.width), int(glyph.left_side_bearing),
+                int(glyph.right_side_bearing))
+    return dgrules.FaceAnalysis.gather(sum(1 for _ in font.glyphs()),
+            dgrules.ANALYSED_CHARS + str(gap_size or ''), glyph_of,
+            successors_of, metrics_of)
+
+
+def new_glyph(font, analysis, name, source=None, hshift=None):
     glyph = font.createChar(-1, name)
     if source:
+        width, lsb, rsb = analysis.metrics[source]
         if hshift:
+            import psMat
             glyph.addReference(source, psMat.translate(hshift, 0))
         else:
             glyph.addReference(source)
-            glyph.left_side_bearing = int(font[source].left_side_bearing)
-            glyph.right_side_bearing = int(font[source].right_side_bearing)
-        glyph.width = int(font[source].width)
+            glyph.left_side_bearing = lsb
+            glyph.right_side_bearing = rsb
+        glyph.width = width
     return glyph
 
-def resize_glyph(font, name, width, cls=None):
-    glyph = font[name]
-    change = int(glyph.width) - width
-    glyph.left_side_bearing = int(glyph.left_side_bearing) - change // 2
+def place_glyph(glyph, lsb, width, cls=None):
+    glyph.left_side_bearing = lsb
     glyph.width = width
     if cls:
         glyph.glyphclass = cls
 
 
-def slide_glyph(font, name, distance):
-    glyph = font[name]
-    glyph.left_side_bearing = int(glyph.left_side_bearing) + distance
-
-
 def rename_font(font, suffix='DG'):
     oldname = font.familyname
     while oldname not in font.fontname and ' ' in oldname:
@@ -148,95 +79,60 @@ def rename_font(font, suffix='DG'):
             font.appendSFNTName(t[0], t[1], t[2].replace(oldname, newname))
 
 
-def patch_a_font(font, monospace, terminal, before, gap_size, huddle):
+def patch_a_font(font, monospace, terminal, before, gap_size, huddle,
+                 class_contexts=False, marker_free=False, dedup_shifts=False,
+                 glyph_budget=dgrules.GLYPH_LIMIT, single_pinch=False,
+                 max_run=None, analysis=None, report=None):
+    # analysis is what analyse_face() found in this face, if that's known
+    # already; nothing else about the font's glyphs is asked of fontforge.
     font.encoding = 'ISO10646'
+    report = report or dgreport.Report()
 
     if terminal:
         monospace = True
 
-    gap_size = find_gap_size(font, gap_size)
-    print(f'zero: {font[ord("0")].width}, gap_size: {gap_size}')
-
-    new_glyph(font, 'thsp.capture3', 'z')
-    new_glyph(font, 'thsp.capture4', 'y')
-    new_glyph(font, 'thsp.capture5', 'x')
-    new_glyph(font, 'thsp.avoid', 'v')
-
-    for d in [3,4,5]:
-        space = find_first(font, '\N{THIN SPACE} ').glyphname
-        comma = find_first(font, ',').glyphname
-        apostrophe = find_first(font, "'").glyphname
-        dot = find_first(font, '.').glyphname
-        new_glyph(font, f'thsp.sep{d}', space)
-        new_glyph(font, f'thsp.comma{d}', comma)
-        new_glyph(font, f'thsp.apostrophe{d}', apostrophe)
-        new_glyph(font, f'thsp.dot{d}', dot)
-
-    dec_group = collect_equivalents(font, '0123456789', not before)
-    hex_group = dec_group | collect_equivalents(font, 'abcdefABCDEF', not before)
-    dsep_group = collect_equivalents(font, '.,', not before)
-    capture_group = ['thsp.capture3','thsp.capture4','thsp.capture5','thsp.avoid']
-    separator_group = set()
-    for d in [3,4,5]:
-        separator_group |= {f'thsp.sep{d}',f'thsp.comma{d}',f'thsp.apostrophe{d}',f'thsp.dot{d}'}
-
-    for gn in separator_group:
-        if monospace:
-            adjustment = -gap_size if gn.endswith('5') else gap_size
-            slide_glyph(font, gn, adjustment)
-            resize_glyph(font, gn, 0, 'mark')
-        else:
-            resize_glyph(font, gn, gap_size)
-
-    #print(f'decimals: {dec_group}')
-    #print(f'hexadecimals: {hex_group}')
-
-    adjustments = {
-        'lf_1_6': -1 * (gap_size // 6),
-        'rt_1_6':  1 * (gap_size // 6),
-        'lf_1_4': -1 * (gap_size // 4),
-        'rt_1_4':  1 * (gap_size // 4),
-        'lf_1_2': -1 * (gap_size // 2),
-        'rt_1_2':  1 * (gap_size // 2),
-        'lf_3_4': -3 * (gap_size // 4),
-        'rt_1_3':  1 * (gap_size // 3),
-        'rt_2_3':  2 * (gap_size // 3),
-        'lf_1_1': -1 * (gap_size // 1),
-        'rt_1_1':  1 * (gap_size // 1),
-    }
-
-    classes = {
-        'dec': dec_group,
-        'hex': hex_group,
-        'sep3': ['thsp.sep3'],
-        'sep4': ['thsp.sep4'],
-        'sep5': ['thsp.sep5'],
-        'anysep3': ['thsp.sep3','thsp.comma3','thsp.apostrophe3','thsp.dot3'],
-        'anysep4': ['thsp.sep4','thsp.comma4','thsp.apostrophe4','thsp.dot4'],
-        'anysep5': ['thsp.sep5','thsp.comma5','thsp.apostrophe5','thsp.dot5'],
-        'cap3': ['thsp.capture3'],
-        'cap4': ['thsp.capture4'],
-        'cap5': ['thsp.capture5'],
-        'avoid': ['thsp.avoid'],
-        'anycap': capture_group,
-        'zero': collect_equivalents(font, '0', not before),
-        'xx': collect_equivalents(font, 'bBoOxX', not before),
-        'dot': collect_equivalents(font, '.', not before),
-        'comma': collect_equivalents(font, ',', not before),
-        'hash': collect_equivalents(font, '#', not before),
-        'dotsep5': dsep_group | {'thsp.sep5','thsp.comma5','thsp.apostrophe5','thsp.dot5'},
-    }
-    for name in adjustments:
-        classes['hex_'+name] = classes['hex']
-        classes['dec_'+name] = classes['dec']
-        if terminal:
-            classes['hex_'+name] = [ v+'.'+name for v in classes['hex'] ]
-            classes['dec_'+name] = [ v+'.'+name for v in classes['dec'] ]
+    with report.phase('analyse'):
+        analysis = analysis or analyse_face(font, gap_size)
+        gap_size = analysis.gap_size(gap_size)
+    existing = analysis.glyph_count
+    print(f'zero: {analysis.width(analysis.cmap["0"])}, gap_size: {gap_size}')
+    with report.phase('plan'):
+        classes, plan, counts, over_budget = dgrules.glyph_plan(
+                lambda basis, alternates: analysis.equivalents(basis,
+                        alternates and not before),
+                monospace, terminal, huddle, marker_free, gap_size,
+                dedup_shifts, existing, glyph_budget, max_run)
+        # class_contexts and single_pinch are left to the fonttools backend:
+        # fontforge's addContextualSubtable() takes one rule per subtable, so
+        # class-based subtables couldn't share anything.
+    print(f'glyphs: {existing} + {sum(counts.values())}')
+    report.count(glyphs=dict(counts, existing=existing),
+                 over_budget=over_budget,
+                 classes={ k: len(v) for k, v in classes.items() },
+                 **dgrules.plan_counts(plan))
+
+    with report.phase('glyphs'):
+        if not marker_free:
+            for name, source in dgrules.MARKERS:
+                new_glyph(font, analysis, name, source)
+
+        for gn, chars in dgrules.separator_glyphs():
+            source = analysis.first(chars)
+            glyph = new_glyph(font, analysis, gn, source)
+            slide, width = dgrules.separator_shift(gn, gap_size, monospace)
+            # slid along, then resized about its middle
+            source_width, lsb, _ = analysis.metrics[source]
+            change = source_width - width
+            place_glyph(glyph, lsb + slide - change // 2, width,
+                        'mark' if monospace else None)
+
+    adjustments = dgrules.adjustments(gap_size)
     classes_fmt = {
         k: '[ ' + ' '.join(v) + ' ]' for k,v in classes.items()
     }
 
     curr_lookup = None
+    curr_table = 'gsub'
     subtable_index = 0
 
     if not before and font.gsub_lookups:
@@ -244,7 +140,11 @@ def patch_a_font(font, monospace, terminal, before, gap_size, huddle):
 
     def new_lookup(name, lu_type, which=Features.ALL):
         features = Features.get(which)
-        nonlocal curr_lookup, subtable_index
+        nonlocal curr_lookup, curr_table, subtable_index
+        if lu_type[:4] != curr_table:
+            # switch to gpos
+            curr_lookup = None
+            curr_table = lu_type[:4]
         if curr_lookup:
             font.addLookup(name, lu_type, None, features, curr_lookup)
         else:
@@ -259,246 +159,493 @@ def patch_a_font(font, monospace, terminal, before, gap_size, huddle):
 
 
     def new_ctx_subtable(st_type, rule):
-        nonlocal curr_lookup, subtable_index, classes_fmt
+        nonlocal curr_lookup, subtable_index
         name = f'{curr_lookup}-{subtable_index}'
         if subtable_index:
             previous = f'{curr_lookup}-{subtable_index-1}'
             font.addContextualSubtable(curr_lookup, name, st_type,
-                    rule.format(**classes_fmt), afterSubtable=previous)
+                    rule, afterSubtable=previous)
         else:
-            font.addContextualSubtable(curr_lookup, name, st_type,
-                    rule.format(**classes_fmt))
+            font.addContextualSubtable(curr_lookup, name, st_type, rule)
         subtable_index += 1
         return name
 
-    def new_coverage(rule):
-        return new_ctx_subtable('coverage', rule)
-
-    def new_rev_coverage(rule):
-        return new_ctx_subtable('reversecoverage', rule)
-
-    # Each lookup is executed in the order they're listed below, but
-    # selectively enabled by their assigned font features.  Within each lookup,
-    # the first matching subtable ends the search and advances to the next
-    # character in the string.
-    #
-    # What are called 'glyph rules' here are substitutions which are described
-    # within the glyph rather than within context rules.  The lookup and
-    # subtable are given the same name so they can be used interchangeably
-    # (glyphs reference the subtable, and subtable rules reference the lookup).
-    #
-    # Broadly, each group of digits is classified by its prefix, in left-to-
-    # right order, and that classification is stretched out to the end of the
-    # group of digits.  Then rules for whole numbers are applied in right-to-
-    # left order to form groups of three or four digits depending on the
-    # capture type, and a rule for decimals is applied in left-to-right order
-    # to form groups of five digits.  Finally another rule sweeps away the
-    # classification markers.
-    #
-    # After that a couple of extra tweaks are applied to use different
-    # characters for the thousand separators if needed.
-
-    # Rules to mark any digit in a string
-    new_glyph_rule('capture_3digit', 'gsub_multiple')
-    new_glyph_rule('capture_4digit', 'gsub_multiple')
-    new_glyph_rule('capture_5digit', 'gsub_multiple')
-    new_glyph_rule('capture_avoid', 'gsub_multiple')
-    # And a rule to remove those marks
-    new_glyph_rule('release_digit', 'gsub_ligature')
-    new_glyph_rule('ignore', 'gsub_single')
-    for g in hex_group:
-        # Arguments for gsub_multiple and gsub_ligature rules look the same,
-        # but they have opposing substitution rules.
-        font[g].addPosSub('capture_3digit', (g, 'thsp.capture3'))
-        font[g].addPosSub('capture_4digit', (g, 'thsp.capture4'))
-        font[g].addPosSub('capture_5digit', (g, 'thsp.capture5'))
-        font[g].addPosSub('capture_avoid', (g, 'thsp.avoid'))
-        for cap in capture_group:
-            font[g].addPosSub('release_digit', (g, cap))
-        font[g].addPosSub('ignore', g)  # is this needed?
-
-    # A rule to insert separator over capture.
-    new_glyph_rule('insert_separator', 'gsub_single')
-    font['thsp.capture3'].addPosSub('insert_separator', 'thsp.sep3')
-    font['thsp.capture4'].addPosSub('insert_separator', 'thsp.sep4')
-    font['thsp.capture5'].addPosSub('insert_separator', 'thsp.sep5')
-
-    # Capture hexadecimal generously if cofigured to do so
-    new_lookup('capture_as_hex', 'gsub_contextchain', Features.HEXADECIMAL)
-    new_coverage('| {hex} @<capture_4digit> | {hex} {hex} {hex} {hex}')
-
-    new_lookup('comma_as_decimal', 'gsub_contextchain', Features.DECIMAL_COMMA)
-    # if it's `n,nnnn` that's a decimal number
-    new_coverage( '{dec} {comma} | {dec} @<capture_5digit> | {dec} {dec} {dec} {dec}')
-    new_coverage('{cap3} {comma} | {dec} @<capture_5digit> | {dec} {dec} {dec} {dec}')
-    # otherwise if it's `,nnnnn` it's not clear what it is, so avoid it.
-    new_coverage(       '{comma} | {dec} @<capture_avoid> | {dec} {dec} {dec}')
-    # and we switch off support for decimal dot, while we're here.
-    new_coverage(   '{dec} {dot} | {dec} @<capture_avoid> | {dec} {dec} {dec}')
-    new_coverage(  '{cap3} {dot} | {dec} @<capture_avoid> | {dec} {dec} {dec}')
-
-    # Captures for all the different digit types
-    new_lookup('capture_numbers', 'gsub_contextchain')
-    # first flow continue any numbers that are already in progress,
-    # but avoid doubling up on captures (can happen when using extra features)...
-    new_coverage('{anycap} | {hex} @<ignore> | {anycap}')
-    # and then fill everything following a capture to match that type
-    new_coverage('{cap3} | {dec} @<capture_3digit> |')
-    new_coverage('{cap4} | {hex} @<capture_4digit> |')
-    new_coverage('{cap5} | {dec} @<capture_5digit> |')
-    new_coverage('{avoid} | {hex} @<capture_avoid> |')
-
-    # Try to avoid #xxxxxx because it's probably a colour code.
-    new_coverage(      '{hash} | {dec} @<capture_3digit> | {dec} {dec} {dec} {dec} {dec} {dec}')
-    new_coverage(      '{hash} | {hex} @<capture_avoid>  | {hex} {hex} {hex} {hex} {hex}')
-
-    # if it's `..nnnnn`, that's probably an integer following a range.
-    new_coverage( '{dot} {dot} | {dec} @<capture_3digit> | {dec} {dec} {dec} {dec}')
-    # if it's `n.nnnn` that's a decimal number
-    new_coverage( '{dec} {dot} | {dec} @<capture_5digit> | {dec} {dec} {dec} {dec}')
-    new_coverage('{cap3} {dot} | {dec} @<capture_5digit> | {dec} {dec} {dec} {dec}')
-    # otherwise if it's `.nnnnn` it's not clear what it is, so avoid it.
-    new_coverage(       '{dot} | {dec} @<capture_avoid> | {dec} {dec} {dec}')
-
-    ## TODO: consider: excluding `x` in middle of number (is it `XXXxYYY`?)
-    # This is already partially-implemented in that the capture will break the
-    # `0x` match.
-    ## TODO: consider `'hxxx` for Verilog, `16#xxx` for VHDL, sh, Ada, etc..
-    new_coverage( '{zero} {xx} | {hex} @<capture_4digit> | {hex} {hex} {hex} {hex}')
-    # Only put the decimal capture at the _first_ decimal digit in a number.
-    new_coverage(             '| {dec} @<capture_3digit> | {dec} {dec} {dec} {dec}')
-
-    # Convert every nth capture into a digit group
-    new_lookup('reflow_numbers_rev', 'gsub_reversecchain')
-    new_rev_coverage('| {cap3} => {sep3} | {dec} {cap3} {dec} {cap3} {dec}')
-    new_rev_coverage('| {cap4} => {sep4} | {hex} {cap4} {hex} {cap4} {hex} {cap4} {hex}')
-    new_lookup('reflow_numbers_fwd', 'gsub_contextchain')
-    new_coverage('{dec} {cap5} {dec} {cap5} {dec} {cap5} {dec} {cap5} {dec}'
-                 ' | {cap5} @<insert_separator> | {dec}')
-
-    # Remove unused capture markers
-    new_lookup('release_numbers', 'gsub_contextchain')
-    new_coverage('| {hex} @<release_digit> {anycap} |')
-
-    # convert separators into commas or apostrophes (TBD, dots?)
-    new_glyph_rule('comma_separator', 'gsub_single', Features.COMMA)
-    new_glyph_rule('apostrophe_separator', 'gsub_single', Features.APOSTROPHE)
-    new_glyph_rule('dot_separator', 'gsub_single', Features.DOT)
-    for d in [3,4,5]:
-        glyph = font[f'thsp.sep{d}']
-        glyph.addPosSub('comma_separator', f'thsp.comma{d}')
-        glyph.addPosSub('apostrophe_separator', f'thsp.apostrophe{d}')
-        glyph.addPosSub('dot_separator', f'thsp.dot{d}')
-
-    if monospace:
-        # I believe it's legal to fold all the lookups onto one line, but
-        # fontforge doesn't seem to support it, so this is unrolled.  It might
-        # be that the multi-lookup form of the table was always split into
-        # separate entries anyway.  I do not know.
-
-        # TODO: Another mode, like huddle, but where where digits are repelled
-        # by the thousand separator.  This also minimises move distance but
-        # will make groups have irregular spacing.  But the thousand separator
-        # gap is always full-sized.
-        if huddle:
-            rules = [
-                '{dotsep5} | {dec} @<rt_1_2> | {dec} {dec} {dec} {dec} {anysep5}',
-                '{dotsep5} {dec_rt_1_2} | {dec} @<rt_1_4> | {dec} {dec} {dec} {anysep5}',
-                # middle digit doesn't move
-                '{dotsep5} {dec_rt_1_2} {dec_rt_1_4} {dec} | {dec} @<lf_1_4> | {dec} {anysep5}',
-                '{dotsep5} {dec_rt_1_2} {dec_rt_1_4} {dec} {dec_lf_1_4} | {dec} @<lf_1_2> | {anysep5}',
-                '{anysep4} | {hex} @<rt_1_2> | {hex} {hex} {hex}',
-                '{anysep4} {hex_rt_1_2} | {hex} @<rt_1_6> | {hex} {hex}',
-                '{anysep4} {hex_rt_1_2} {hex_rt_1_6} | {hex} @<lf_1_6> | {hex}',
-                '{anysep4} {hex_rt_1_2} {hex_rt_1_6} {hex_lf_1_6} | {hex} @<lf_1_2> |',
-                '{anysep3} | {dec} @<rt_1_2> | {dec} {dec}',
-                # middle digit doesn't move
-                '{anysep3} {dec_rt_1_2} {dec} | {dec} @<lf_1_2> |',
-            ]
-        else:
-            rules = [
-                # first digit doesn't move
-                '{dotsep5} {dec} | {dec} @<lf_1_4> | {dec} {dec} {dec} {anysep5}',
-                '{dotsep5} {dec} {dec_lf_1_4} | {dec} @<lf_1_2> | {dec} {dec} {anysep5}',
-                '{dotsep5} {dec} {dec_lf_1_4} {dec_lf_1_2} | {dec} @<lf_3_4> | {dec} {anysep5}',
-                '{dotsep5} {dec} {dec_lf_1_4} {dec_lf_1_2} {dec_lf_3_4} | {dec} @<lf_1_1> | {anysep5}',
-                '{anysep4} | {hex} @<rt_1_1> | {hex} {hex} {hex}',
-                '{anysep4} {hex_rt_1_1} | {hex} @<rt_2_3> | {hex} {hex}',
-                '{anysep4} {hex_rt_1_1} {hex_rt_2_3} | {hex} @<rt_1_3> | {hex}',
-                # last digit doesn't move
-                '{anysep3} | {dec} @<rt_1_1> | {dec} {dec}',
-                '{anysep3} {dec_rt_1_1} | {dec} @<rt_1_2> | {dec}',
-                # last digit doesn't move
-            ]
-
-        useful_adjustments = {}
-        pat = re.compile(r'{([a-z_0-9]+)} @<([a-z_0-9]+)>')
-        for r in rules:
-            match = pat.search(r)
-            name, digits = match.group(2, 1)
-            digits = set(classes[digits])
-            digits |= useful_adjustments.get(name, set())
-            useful_adjustments[name] = digits
-
-        if terminal:
-            for name, glyphs in useful_adjustments.items():
-                new_glyph_rule(name, 'gsub_single')
-                for g in glyphs:
-                    adjusted_g = g+'.'+name
-                    new_glyph(font, adjusted_g, g, adjustments[name])
-                    font[g].addPosSub(name, adjusted_g)
-
-            new_lookup('pinch_digits', 'gsub_contextchain')
-        else:
-            # switch to gpos
-            curr_lookup = None
-
-            for name, glyphs in useful_adjustments.items():
-                new_glyph_rule(name, 'gpos_single')
-                for g in glyphs:
+    for kind, name, *args in plan:
+        with report.phase(dgrules.plan_phase(kind, name)):
+            if kind == 'lookup':
+                new_lookup(name, *args)
+            elif kind == 'glyph_rule':
+                new_glyph_rule(name, *args)
+            elif kind == 'sub':
+                for g in dgrules.class_union(classes, args[0]):
+                    font[g].addPosSub(name, dgrules.expand(args[1], g))
+            elif kind == 'pos':
+                for g in dgrules.class_union(classes, args[0]):
                     font[g].addPosSub(name, adjustments[name], 0, 0, 0)
-
-            new_lookup('pinch_digits', 'gpos_contextchain')
-
-        for r in rules:
-            new_ctx_subtable('coverage', r)
+            elif kind == 'shift':
+                for g in dgrules.class_union(classes, args[0]):
+                    new_glyph(font, analysis, g+'.'+name, g,
+                              adjustments[name])
+            elif kind == 'copy':
+                for g in dgrules.class_union(classes, args[0]):
+                    new_glyph(font, analysis, g+'.'+name, g)
+            else:
+                new_ctx_subtable(kind, args[0].format(**classes_fmt))
 
     return font
 
 
-def main(inputs, output, always_on, rename, **kwargs):
+def face_filename(output, n, fullname):
+    filename = output
+    with contextlib.suppress(TypeError):
+        filename = output % n
+    with contextlib.suppress(TypeError):
+        filename = output % fullname
+    return filename
+
+
+def faces_in_file(path, backend):
+    # (font_id, face name) for each face in a font file
+    if backend == 'fonttools':
+        import dgfonttools
+        return [ ((path, i), str(i)) for i in dgfonttools.faces_in_file(path) ]
+    import fontforge
+    return [ (f'{path}({name})', name) for name in fontforge.fontsInFile(path) ]
+
+
+FONT_EXTENSIONS = ('.ttf', '.otf', '.ttc', '.otc')
+
+
+def input_files(paths):
+    # The paths given, with each directory replaced by all the font files
+    # under it, in a stable order.
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for name in sorted(filenames):
+                if name.lower().endswith(FONT_EXTENSIONS):
+                    yield os.path.join(dirpath, name)
+
+# fontforge preferences and generate() flags for --fast-generate: don't
+# autohint glyphs on the way out, which leaves the hinting the font came with
+# as the only hinting, and don't add FontForge's own timestamp table.
+FAST_GENERATE_PREFS = { 'AutoHint': False }
+FAST_GENERATE_FLAGS = ('opentype', 'no-FFTM-table')
+
+
+@contextlib.contextmanager
+def preferences(**prefs):
+    # Preferences this build of fontforge doesn't have are left alone.
+    import fontforge
+    old = {}
+    for name, value in prefs.items():
+        with contextlib.suppress(TypeError):
+            old[name] = fontforge.getPrefs(name)
+            fontforge.setPrefs(name, value)
+    try:
+        yield
+    finally:
+        for name, value in old.items():
+            fontforge.setPrefs(name, value)
+
+
+def generate_font(font, filename, fast_generate=False):
+    if not fast_generate:
+        font.generate(filename)
+        return
+    with preferences(**FAST_GENERATE_PREFS):
+        font.generate(filename, flags=FAST_GENERATE_FLAGS)
+
+
+@contextlib.contextmanager
+def restoring(font):
+    # Take back the glyphs, lookups and names that patching and renaming add
+    # to a fontforge font, so that it can be patched again another way
+    # without opening it again.
+    glyphs = set(font)
+    lookups = set(font.gsub_lookups + font.gpos_lookups)
+    names = (font.familyname, font.fullname, font.fontname, font.sfnt_names)
+    try:
+        yield font
+    finally:
+        for lookup in font.gsub_lookups + font.gpos_lookups:
+            if lookup not in lookups:
+                font.removeLookup(lookup)
+        for name in [ g for g in font if g not in glyphs ]:
+            font.removeGlyph(font[name])
+        font.familyname, font.fullname, font.fontname, font.sfnt_names = names
+
+
+def patch_face(font_id, variants, backend='fontforge', cache=None,
+               analysis_key=None, overlay=False, fast_generate=False,
+               measure_generate=False, **kwargs):
+    # Patch one face in each of the ways in variants, which are dicts of the
+    # output and n for face_filename(), and optionally a rename suffix, a
+    # feature to turn always_on, a cache_key, a report to fill in and
+    # options to use instead of those in kwargs.  The face is opened and
+    # measured once for all of them: fontforge patches the same font over
+    # and over, undoing each time, while fontTools only has to reopen the
+    # file lazily.  The face's analysis is kept in the cache under
+    # analysis_key, so other options needn't measure it again.  Returns
+    # (filename, cache hit, report) for each variant, with no filename for a
+    # variant refused for going over the glyph budget.
+    if backend == 'fonttools':
+        import dgfonttools as ft
+    results = []
+    font = analysis = None
+
+    def analyse(analyse_face, gap_size):
+        nonlocal analysis
+        if cache and analysis_key:
+            record = cache.fetch_record(analysis_key)
+            if record:
+                analysis = dgrules.FaceAnalysis.from_dict(record)
+                return
+        analysis = analyse_face(font, gap_size)
+        if cache and analysis_key:
+            cache.store_record(analysis_key, analysis.as_dict())
+
+    with contextlib.ExitStack() as opened:
+        for variant in variants:
+            output, n = variant['output'], variant['n']
+            rename = variant.get('rename')
+            report = variant.get('report') or dgreport.Report()
+            options = dict(kwargs, **variant.get('options', {}))
+            if cache:
+                filename = cache.fetch(variant['cache_key'],
+                        lambda meta: face_filename(output, n, meta['fullname']))
+                if filename:
+                    report.count(cached=True,
+                                 output_bytes=os.path.getsize(filename))
+                    results.append((filename, True, report))
+                    continue
+            try:
+                with contextlib.ExitStack() as stack:
+                    stack.enter_context(
+                            Features.always_on(variant.get('always_on')))
+                    if backend == 'fonttools':
+                        with report.phase('open'):
+                            font = ft.open_font(font_id)
+                            stack.callback(font.close)
+                            if rename:
+                                ft.rename_font(font, rename)
+                        if analysis is None:
+                            with report.phase('analyse'):
+                                analyse(ft.analyse_face, options['gap_size'])
+                        font = ft.patch_a_font(font, analysis=analysis,
+                                               report=report, **options)
+                        fullname = ft.full_name(font)
+                    else:
+                        if font is None:
+                            with report.phase('open'):
+                                import fontforge
+                                font = fontforge.open(font_id)
+                                opened.callback(font.close)
+                            with report.phase('analyse'):
+                                analyse(analyse_face, options['gap_size'])
+                        stack.enter_context(restoring(font))
+                        if rename:
+                            rename_font(font, rename)
+                        patch_a_font(font, analysis=analysis, report=report,
+                                     **options)
+                        fullname = font.fullname
+                    filename = face_filename(output, n, fullname)
+                    # The old output may be a hard link into the cache, so
+                    # never write through it.
+                    with contextlib.suppress(FileNotFoundError):
+                        os.unlink(filename)
+                    with report.phase('generate'):
+                        if backend == 'fonttools':
+                            ft.generate(font, filename)
+                        elif filename.endswith('.sfnt'):
+                            # scratch copy of a face on its way into a
+                            # collection
+                            layer = font.layers[font.activeLayer]
+                            filename = filename[:-5] + (
+                                    '.ttf' if layer.is_quadratic else '.otf')
+                            generate_font(font, filename, fast_generate)
+                        else:
+                            #font.generateFeatureFile(os.path.splitext(filename)[0] + '.fea')
+                            generate_font(font, filename, fast_generate)
+                    if measure_generate and fast_generate \
+                            and backend != 'fonttools':
+                        # the same face again the default way, to a scratch
+                        # file
+                        with report.phase('default_generate'), \
+                                tempfile.TemporaryDirectory() as tmpdir:
+                            generate_font(font, os.path.join(tmpdir,
+                                    os.path.basename(filename)))
+                        phases = report.phases
+                        report.count(generate_saved_seconds=
+                                phases['default_generate']['seconds']
+                                - phases['generate']['seconds'])
+            except dgrules.OverBudget as e:
+                # nothing was written for it, and the other variants and
+                # faces carry on
+                report.count(refused=str(e))
+                results.append((None, False, report))
+                continue
+            if overlay:
+                import dgoverlay
+                with report.phase('overlay'):
+                    dgoverlay.make_overlay(filename)
+            report.count(cached=False, output_bytes=os.path.getsize(filename))
+            if cache:
+                cache.store(variant['cache_key'], filename, fullname=fullname)
+            results.append((filename, False, report))
+    return results
+
+
+def report_glyphs(font_id, name, backend, before, gap_size, marker_free,
+                 dedup_shifts, glyph_budget, **kwargs):
+    # How many glyphs each mode would add to a face, without patching it.
+    if backend == 'fonttools':
+        import dgfonttools as ft
+        font = ft.open_font(font_id)
+        analysis = ft.analyse_face(font, gap_size)
+    else:
+        import fontforge
+        font = fontforge.open(font_id)
+        analysis = analyse_face(font, gap_size)
+    existing = analysis.glyph_count
+    gap_size = analysis.gap_size(gap_size)
+    print(f'{name}: {existing} glyphs, gap_size: {gap_size}')
+    for mode, options in dgrules.MODES.items():
+        try:
+            _, _, counts, over_budget = dgrules.glyph_plan(
+                    lambda basis, alternates: analysis.equivalents(basis,
+                            alternates and not before),
+                    marker_free=marker_free, gap_size=gap_size,
+                    dedup_shifts=dedup_shifts, existing=existing,
+                    budget=glyph_budget, **options)
+        except ValueError as e:
+            print(f'  {mode}: {e}')
+            continue
+        detail = ', '.join( f'{n} {what}' for what, n in counts.items() if n )
+        print(f'  {mode}: +{sum(counts.values())} ({detail})')
+        for what in over_budget:
+            print(f'  {mode}: over glyph budget: {what}')
+    font.close()
+
+
+def _patch_job(args):
+    font_id, variants, kwargs = args
+    return [ (filename, hit, report.as_dict(), None) for filename, hit, report
+             in patch_face(font_id, variants, **kwargs) ]
+
+
+def _isolated_patch_job(args):
+    # In a batch, one face failing shouldn't stop all the others.
+    try:
+        return _patch_job(args)
+    except Exception as e:
+        return [ (None, False, {}, f'{type(e).__name__}: {e}') ] * len(args[1])
+
+
+def variant(spec, rename):
+    # What a --variants spec, mode or mode:feature, changes: the options for
+    # the mode, the feature to turn on always, and the rename suffix, which
+    # has no spaces so that it can go in the PostScript name too.
+    mode, _, feature = spec.partition(':')
+    return dict(options=dgrules.MODES[mode], always_on=feature or None,
+                rename=rename and rename + mode.title() + feature.upper())
+
+
+def main(inputs, output, always_on, jobs, cache_dir, cache_size, glyph_report,
+         report, manifest, rename, variants, **kwargs):
+    start = time.perf_counter()
     write_ttc = output.lower().endswith('.ttc')
+    backend = kwargs['backend']
+    if kwargs['overlay'] and write_ttc:
+        raise SystemExit('--overlay fonts can\'t go in a collection')
+    if manifest and write_ttc:
+        raise SystemExit('a --manifest batch can\'t go in a collection')
+    if variants and len(variants) > 1 and not rename:
+        raise SystemExit('--variants need --rename to tell them apart')
     if always_on:
         Features.make_always(always_on)
-    ttc_fonts = []
-    n = 0
-    for font_file in inputs:
-        for font_name in fontforge.fontsInFile(font_file.name):
-            font_id = f'{font_file.name}({font_name})'
-            font = fontforge.open(font_id)
-            if rename:
-                rename_font(font, rename)
-            font = patch_a_font(font, **kwargs)
+    if glyph_report:
+        for path in input_files(inputs):
+            faces = faces_in_file(path, backend)
+            for font_id, font_name in faces:
+                if len(faces) > 1:
+                    font_name = f'{path}({font_name})'
+                else:
+                    font_name = path
+                report_glyphs(font_id, font_name, **kwargs)
+        return
+    if jobs < 1:
+        jobs = os.cpu_count()
+    cache = None
+    if cache_dir:
+        cache = dgcache.OutputCache(cache_dir, cache_size)
+        # Everything that writes the outputs, by path so that the modules
+        # (and fontTools) needn't be imported just for this.
+        here = os.path.dirname(os.path.abspath(__file__))
+        stamp = dgcache.version_stamp(__version__, __file__, dgrules.__file__,
+                os.path.join(here, 'dgfonttools.py'),
+                os.path.join(here, 'dgoverlay.py'))
+
+    with contextlib.ExitStack() as stack:
+        if manifest:
+            # The output pattern is an option too, so that a different -o
+            # patches everything again rather than skipping it all.
+            manifest = dgmanifest.Manifest(manifest,
+                    dict(kwargs, always_on=always_on, rename=rename,
+                         output=os.path.abspath(output)))
+            stack.callback(manifest.close)
+        face_output = output
+        if write_ttc:
+            # Faces are saved individually and closed as soon as they're
+            # done, which lets them come from worker processes or from the
+            # cache, and then streamed into the collection one table at a
+            # time.
+            tmpdir = stack.enter_context(tempfile.TemporaryDirectory())
+            face_output = os.path.join(tmpdir, '%05d.sfnt')
+
+        job_args = []
+        job_names = []
+        numbers = itertools.count()
+        patched = skipped = failed = refused = 0
+        for path in input_files(inputs):
+            try:
+                faces = faces_in_file(path, backend)
+                if cache:
+                    digest = dgcache.file_digest(path)
+            except Exception as e:
+                if not manifest:
+                    raise
+                print(f'failed: {path}: {e}')
+                manifest.record(path, None, error=f'{type(e).__name__}: {e}')
+                failed += 1
+                continue
+            for font_id, font_name in faces:
+                # Every variant of a face is patched by the same job, so the
+                # face is only opened once.
+                face_variants = []
+                names = []
+                for spec in variants or [ None ]:
+                    # numbered the same whether or not earlier ones are skipped
+                    n = next(numbers)
+                    name = f'{font_name} {spec}' if spec else font_name
+                    if manifest and manifest.done(path, name):
+                        skipped += 1
+                        continue
+                    face_variant = dict(output=face_output, n=n, rename=rename)
+                    if spec:
+                        face_variant.update(variant(spec, rename))
+                    if cache:
+                        face_variant['cache_key'] = cache.key(input=digest,
+                            face=font_name,
+                            options=dict(kwargs,
+                                         **face_variant.get('options', {})),
+                            rename=face_variant['rename'],
+                            always_on=[ always_on,
+                                        face_variant.get('always_on') ],
+                            format=os.path.splitext(face_output)[1].lower(),
+                            version=stamp)
+                    face_variants.append(face_variant)
+                    names.append((path, name))
+                if face_variants:
+                    analysis_key = cache and cache.key(input=digest,
+                            face=font_name, backend=backend,
+                            gap_size=kwargs['gap_size'], version=stamp)
+                    job_args.append((font_id, face_variants,
+                                     dict(kwargs, cache=cache,
+                                          analysis_key=analysis_key)))
+                    job_names.append(names)
+
+        patch_job = _isolated_patch_job if manifest else _patch_job
+        if jobs == 1:
+            results = map(patch_job, job_args)
+        else:
+            # Each worker opens, patches and generates one face on its own.
+            # imap() hands the results back in input order so numbering and
+            # collection order match the single-process path.
+            pool = stack.enter_context(multiprocessing.Pool(
+                    jobs, Features.make_always if always_on else None,
+                    (always_on,)))
+            results = pool.imap(patch_job, job_args)
+
+        ttc_faces = []
+        hits = 0
+        face_reports = []
+        for (input_name, font_name), (filename, hit, face_report, error) \
+                in zip(itertools.chain.from_iterable(job_names),
+                       itertools.chain.from_iterable(results)):
+            if error:
+                print(f'failed: {input_name}({font_name}): {error}')
+                manifest.record(input_name, font_name, error=error)
+                failed += 1
+                face_reports.append(dict(input=input_name, face=font_name,
+                                         error=error))
+                continue
+            if face_report.get('refused'):
+                print(f'refused: {input_name}({font_name}): '
+                      f'{face_report["refused"]}')
+                if manifest:
+                    manifest.record(input_name, font_name,
+                                    error=face_report['refused'])
+                refused += 1
+                face_reports.append(dict(face_report, input=input_name,
+                                         face=font_name, output=None))
+                continue
+            if manifest:
+                manifest.record(input_name, font_name, filename)
+            patched += 1
+            hits += hit
+            for what in face_report.get('over_budget', ()):
+                print(f'over glyph budget: {input_name}({font_name}): {what}')
+            face_reports.append(dict(face_report, input=input_name,
+                    face=font_name, output=None if write_ttc else filename))
             if write_ttc:
-                ttc_fonts.append(font)
+                ttc_faces.append(filename)
             else:
-                filename = output
-                with contextlib.suppress(TypeError):
-                    filename = output % n
-                    n = n + 1
-                with contextlib.suppress(TypeError):
-                    filename = output % font.fullname
-                #font.generateFeatureFile(os.path.splitext(filename)[0] + '.fea')
-                font.generate(filename)
                 print('saved: ', filename)
-                font.close()
-
-    if ttc_fonts:
-        ttc_fonts[0].generateTtc(output, ttc_fonts[1:],
-                ttcflags=('merge',), layer=ttc_fonts[0].activeLayer)
-        print('saved: ', output)
-    for font in ttc_fonts:
-        font.close()
+        collection = dgreport.Report()
+        if ttc_faces:
+            with collection.phase('generate'):
+                tables, entries = dgttc.write_ttc(ttc_faces, output)
+            collection.count(output=output, tables=tables,
+                             shared_tables=entries - tables,
+                             output_bytes=os.path.getsize(output))
+
+    if kwargs['overlay']:
+        import dgoverlay
+        print('unicode-range: ', dgoverlay.unicode_range())
+
+    if cache:
+        evicted, size = cache.evict()
+        print(f'cache: {hits} hits, {patched - hits} misses, '
+              f'{evicted} evicted, {size} bytes')
+
+    if report:
+        with open(report, 'w') as f:
+            json.dump({
+                'version': __version__,
+                'options': dict(kwargs, always_on=always_on, rename=rename,
+                                variants=variants, jobs=jobs),
+                'seconds': time.perf_counter() - start,
+                'generate_seconds': sum(
+                        f.get('phases', {}).get('generate', {}).get('seconds', 0)
+                        for f in face_reports),
+                'generate_saved_seconds': sum(
+                        f.get('generate_saved_seconds', 0)
+                        for f in face_reports)
+                        if kwargs['measure_generate'] else None,
+                'faces': face_reports,
+                'collection': collection.as_dict() if ttc_faces else None,
+            }, f, indent=1)
+        print('saved: ', report)
+
+    if manifest:
+        print(f'manifest: {patched} patched, {skipped} skipped,'
+              f' {refused} refused, {failed} failed')
+    if failed or refused:
+        raise SystemExit(1)
 
 
 def float_or_pct(string):
@@ -507,13 +654,36 @@ def float_or_pct(string):
     return float(string)
 
 
-if __name__ == "__main__":
+def font_path(string):
+    if not os.path.exists(string):
+        raise argparse.ArgumentTypeError(f"can't open '{string}'")
+    return string
+
+
+def positive_int(string):
+    value = int(string)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"'{string}' isn't a positive number")
+    return value
+
+
+def variant_list(string):
+    specs = string.split(',')
+    for spec in specs:
+        mode = spec.partition(':')[0]
+        if mode not in dgrules.MODES:
+            raise argparse.ArgumentTypeError(f"unknown mode '{mode}' "
+                    f"(choose from {', '.join(dgrules.MODES)})")
+    return specs
+
+
+def argument_parser():
     parser = argparse.ArgumentParser(
         description=('Add font-based digit grouping. ')
     )
     parser.add_argument('inputs', metavar='filename',
-            help='Font files to patch.',
-            nargs='+', type=argparse.FileType('rb'))
+            help='Font files, or directories of them, to patch.',
+            nargs='+', type=font_path)
     parser.add_argument('-o', '--output', metavar='filename',
             help='Output filename or %%-format string (.ttf or .ttc).',
             nargs='?', default='%s.ttf')
@@ -530,6 +700,10 @@ if __name__ == "__main__":
     parser.add_argument('--always-on', metavar='feature',
             help='Turn feature on without further configuration.',
             nargs='?', default=None, const='dgsp')
+    parser.add_argument('--variants', metavar='mode[:feature],...',
+            help='Patch each face in each of these modes in one go, '
+                 'optionally with a feature always on.',
+            type=variant_list, default=None)
     parser.add_argument('--huddle',
             help='Huddle digit groups towards centre to reduce clipping.',
             default=False, action='store_true')
@@ -547,5 +721,59 @@ if __name__ == "__main__":
             nargs='?', default='DG', const='DG')
     parser.add_argument('--no-rename',
             dest='rename', action='store_const', const=None)
+    parser.add_argument('--marker-free',
+            help='Classify digits in place instead of inserting markers.',
+            default=False, action='store_true')
+    parser.add_argument('--class-contexts',
+            help='Merge contextual rules into class-based subtables.',
+            default=False, action='store_true')
+    parser.add_argument('--single-pinch',
+            help='Pinch digits with one class-based GPOS subtable.',
+            default=False, action='store_true')
+    parser.add_argument('--dedup-shifts',
+            help='In terminal mode, share shifted digits between equal moves.',
+            default=False, action='store_true')
+    parser.add_argument('--max-run', metavar='N',
+            help='Leave runs of more than N digits ungrouped, to bound the '
+                 'cost of shaping them.',
+            type=positive_int, default=None)
+    parser.add_argument('--glyph-budget', metavar='N',
+            help='Most glyphs a patched font may have, degrading to fit.',
+            type=int, default=dgrules.GLYPH_LIMIT)
+    parser.add_argument('--glyph-report',
+            help='Report how many glyphs each mode would add, and stop.',
+            default=False, action='store_true')
+    parser.add_argument('--overlay',
+            help='Keep only digits and what groups them, eg. for web fonts.',
+            default=False, action='store_true')
+    parser.add_argument('--fast-generate',
+            help='Generate without autohinting or extra tables (fontforge).',
+            default=False, action='store_true')
+    parser.add_argument('--measure-generate',
+            help='With --fast-generate, also generate each face the default '
+                 'way and report the time saved.',
+            default=False, action='store_true')
+    parser.add_argument('--backend',
+            help='Patch with fontforge, or edit tables directly with fontTools.',
+            choices=('fontforge', 'fonttools'), default='fontforge')
+    parser.add_argument('-j', '--jobs', metavar='N',
+            help='Patch N faces at once in worker processes (0: one per CPU).',
+            type=int, default=1)
+    parser.add_argument('--cache', metavar='dir', dest='cache_dir',
+            help='Reuse patched fonts from this directory when unchanged.',
+            default=None)
+    parser.add_argument('--cache-size', metavar='size',
+            help='Evict least recently used cache entries beyond this size.',
+            type=dgcache.parse_size, default='1G')
+    parser.add_argument('--report', metavar='file',
+            help='Write timings, memory use and counts for each face as JSON.',
+            default=None)
+    parser.add_argument('--manifest', metavar='file',
+            help='Record each face done, skip those already done, and carry '
+                 'on past failures.',
+            default=None)
+    return parser
 
-    main(**vars(parser.parse_args()))
+
+if __name__ == "__main__":
+    main(**vars(argument_parser().parse_args()))